@@ -0,0 +1,96 @@
+"""
+Small in-process caches for values that are read on every request
+
+Each cache entry lives for ``ttl`` seconds. ``invalidate_on_commit`` registers
+SQLAlchemy session events so a cache is cleared as soon as a transaction that
+touched one of the given models commits. The caches are per process, so with
+several gunicorn workers the TTL bounds how stale another worker can be.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from metrics import record_cache_lookup
+
+
+class TTLCache:
+    """قاموس بسيط آمن مع الخيوط، كل قيمة فيه تنتهي بعد ttl ثانية
+
+    الذاكرة المسماة (name) تسجل مرات الإصابة والإخفاق في مقاييس /metrics.
+    """
+
+    def __init__(self, ttl=60, name=None):
+        self.ttl = ttl
+        self.name = name
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, record=True):
+        """record=False لإعادة فحص نفس المفتاح دون احتسابه مرة ثانية في المقاييس"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                entry = None
+        if self.name and record:
+            record_cache_lookup(self.name, entry is not None)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """إرجاع القيمة المخزنة أو حسابها بـ factory() وتخزينها"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_watched = []  # (cache, models)
+
+
+def _pending_caches(session):
+    return session.info.setdefault('caches_to_invalidate', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_touched_caches(session, flush_context):
+    touched = session.new | session.dirty | session.deleted
+    if not touched:
+        return
+    for cache, models in _watched:
+        if any(isinstance(obj, models) for obj in touched):
+            _pending_caches(session).add(cache)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_touched_caches(session):
+    if session.in_nested_transaction():
+        return
+    for cache in session.info.pop('caches_to_invalidate', ()):
+        cache.clear()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_touched_caches(session, previous_transaction):
+    # التراجع عن savepoint لا يلغي ما تم في المعاملة الخارجية
+    if previous_transaction.parent is None:
+        session.info.pop('caches_to_invalidate', None)
+
+
+def invalidate_on_commit(cache, *models):
+    """مسح cache عند commit أي معاملة أضافت أو عدلت أو حذفت كائناً من models"""
+    _watched.append((cache, tuple(models)))
+    return cache
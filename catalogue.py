@@ -0,0 +1,131 @@
+"""
+Product catalogue served to POS terminals and the offline sync
+
+``catalogue_version`` identifies the current state of products and
+categories from a single aggregate query, so clients that already hold the
+catalogue can be answered with ``304 Not Modified`` without loading it.
+
+``cached_catalogue_json`` keeps the serialised catalogue of the current
+version in memory, so a worker loads and serialises the products once per
+catalogue change instead of once per POS terminal. The version is checked on
+every request, which also catches changes committed by other workers and by
+bulk UPDATEs that ORM events do not see.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from models import db, Product, Category
+
+
+logger = logging.getLogger(__name__)
+
+_build_lock = threading.Lock()
+
+
+def catalogue_version():
+    """نسخة الكتالوج: عدد المنتجات وآخر تعديل على المنتجات والفئات"""
+    category_changed = db.session.query(func.max(Category.updated_at)).scalar_subquery()
+    count, product_changed, category_changed = db.session.query(
+        func.count(Product.id),
+        func.max(Product.updated_at),
+        category_changed
+    ).one()
+    return hashlib.sha1(f'{count}|{product_changed}|{category_changed}'.encode()).hexdigest()[:20]
+
+
+def product_to_dict(p):
+    """تمثيل المنتج كما تتوقعه صفحة البيع والمزامنة"""
+    wholesale_price = p.wholesale_price if p.wholesale_price else (p.price if p.price else 0)
+    retail_price = p.retail_price if p.retail_price else (p.price if p.price else 0)
+
+    product_data = {
+        'id': p.id,
+        'name': p.name_ar or 'منتج غير محدد',
+        'wholesale_price': float(wholesale_price),
+        'retail_price': float(retail_price),
+        'price': float(retail_price),  # Use retail_price as the main price
+        'stock': float(p.stock_quantity or 0),
+        'unit_type': p.unit_type or 'كامل',
+        'category': p.category.name_ar if p.category else 'غير محدد',
+        'min_stock_threshold': float(p.min_stock_threshold or 10),
+        'profit_margin': 0,
+        'profit_percentage': 0
+    }
+
+    if wholesale_price > 0 and retail_price > 0:
+        profit_margin = retail_price - wholesale_price
+        product_data['profit_margin'] = float(profit_margin)
+        product_data['profit_percentage'] = float(profit_margin / wholesale_price * 100)
+
+    return product_data
+
+
+def catalogue_query():
+    """استعلام المنتجات مع فئاتها (JOIN واحد بدلاً من استعلام لكل منتج)"""
+    return Product.query.options(joinedload(Product.category)).order_by(Product.id)
+
+
+def catalogue_products():
+    """جميع المنتجات مع فئاتها في استعلام واحد"""
+    return catalogue_query().all()
+
+
+def catalogue_json():
+    """الكتالوج كاملاً كنص JSON جاهز للإرسال"""
+    result = []
+    for p in catalogue_products():
+        try:
+            result.append(product_to_dict(p))
+        except Exception as e:
+            # Skip problematic products but log the error
+            logger.error(f"Error processing product {p.id}: {str(e)}")
+    return json.dumps(result, ensure_ascii=False)
+
+
+def cached_catalogue_json(cache, version):
+    """نص الكتالوج للنسخة version من cache، أو بناؤه مرة واحدة وتخزينه
+
+    cache يحتفظ بنسخة واحدة فقط (أحدث نسخة طُلبت). عند تغير الكتالوج يبنيه
+    طلب واحد وتنتظر بقية الطلبات المتزامنة النتيجة بدلاً من بنائه معاً.
+    """
+    body = cache.get(version)
+    if body is not None:
+        return body
+    with _build_lock:
+        body = cache.get(version, record=False)
+        if body is not None:
+            return body
+        body = catalogue_json()
+        cache.clear()
+        cache.set(version, body)
+        return body
+
+
+def products_by_id(product_ids):
+    """تحميل المنتجات المطلوبة باستعلام IN واحد. ترجع dict: product_id -> Product"""
+    product_ids = {product_id for product_id in product_ids if product_id is not None}
+    if not product_ids:
+        return {}
+    return {product.id: product for product in Product.query.filter(Product.id.in_(product_ids))}
+
+
+def category_product_counts():
+    """عدد المنتجات في كل فئة. ترجع dict: category_id -> العدد"""
+    return dict(db.session.query(Product.category_id, func.count(Product.id)).group_by(Product.category_id))
+
+
+def category_to_dict(c, product_count=0):
+    """تمثيل الفئة كما تتوقعه صفحات المخزون والمزامنة"""
+    return {
+        'id': c.id,
+        'name': c.name_ar,
+        'description': c.description_ar or '',
+        'product_count': product_count,
+        'created_at': c.created_at.isoformat() if c.created_at else None
+    }
@@ -15,6 +15,8 @@ class Config:
     # Database configuration
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_RECORD_QUERIES = True
+    # تحذير في السجل عند تكرار نفس الاستعلام أكثر من هذا العدد في طلب واحد (N+1)
+    SQL_REPEATED_QUERY_THRESHOLD = int(os.environ.get('SQL_REPEATED_QUERY_THRESHOLD', 20))
     
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
@@ -26,10 +28,19 @@ class Config:
     APP_NAME = os.environ.get('APP_NAME', 'إدارة Norko Store')
     APP_VERSION = os.environ.get('APP_VERSION', '1.0.0')
     
+    # Cache settings (seconds)
+    DEBT_STATS_CACHE_TTL = int(os.environ.get('DEBT_STATS_CACHE_TTL', 60))
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 5))
+    CATALOGUE_CACHE_TTL = int(os.environ.get('CATALOGUE_CACHE_TTL', 3600))
+    
     # Upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    # Relative to the project directory unless absolute; background job files go in <UPLOAD_FOLDER>/jobs
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
     
+    # Background jobs (threads per worker process for imports and exports)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    
     # Email settings (for password reset)
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -50,6 +61,9 @@ class Config:
     # Logging
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    
+    # Prometheus metrics (/metrics). Disabled (404) unless set; scrapers send "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -134,7 +148,7 @@ class VPSConfig(Config):
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     LOGIN_DISABLED = True
 
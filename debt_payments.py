@@ -0,0 +1,127 @@
+"""
+Debt payments spread over a customer's unpaid credit sales, oldest first
+
+``allocate_payments`` reads what is still owed on every unpaid sale of the
+given customers with one aggregate query, splits each customer's amount over
+those sales in memory (FIFO by sale date), then writes all the payments with
+one bulk INSERT, the new sale statuses with one UPDATE, and the customer
+balances with one UPDATE. The customer rows are locked first so two
+payments for the same customer cannot both be allocated against the same
+remaining amount. It backs the quick payment and the "pay all debts" batch.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import case, insert, select
+
+from models import db, Customer, Sale, Payment
+from ledger import record_payments, adjust_customer_balances
+from reporting import unpaid_sales_query
+
+
+# عدد العملاء في كل معاملة عند تسديد ديون عدد كبير من العملاء
+PAYMENT_BATCH_SIZE = 500
+
+
+class PaymentBatchFailed(Exception):
+    """فشلت إحدى معاملات pay_all_debts بعد حفظ المعاملات السابقة
+
+    totals ما تم تسديده وحفظه فعلاً قبل الخطأ (بنفس شكل نتيجة pay_all_debts).
+    """
+
+    def __init__(self, error, totals):
+        super().__init__(str(error))
+        self.totals = totals
+
+
+def _lock_customers(customer_ids):
+    table = Customer.__table__
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # SQLite لا يدعم FOR UPDATE: أول كتابة تبدأ معاملة الكتابة وتمنع أي كتابة متزامنة
+        db.session.execute(table.update().where(table.c.id.in_(customer_ids)).values(
+            balance=table.c.balance, updated_at=table.c.updated_at))
+    else:
+        db.session.execute(
+            select(table.c.id).where(table.c.id.in_(customer_ids)).order_by(table.c.id).with_for_update()
+        )
+
+
+def allocate_payments(amounts, user_id, payment_method='نقدي', notes=None, when=None):
+    """توزيع دفعات العملاء {customer_id: المبلغ} على مبيعاتهم غير المسددة (الأقدم أولاً)
+
+    المبلغ None يعني تسديد كل دين العميل. التنفيذ داخل المعاملة الحالية
+    والاستدعاء يكون قبل commit. ترجع dict: customer_id -> {'payments':
+    [{'sale_id', 'amount'}], 'applied': المبلغ الموزع، 'unallocated': ما
+    زاد عن الدين}.
+    """
+    now = when or datetime.utcnow()
+    customer_ids = sorted(amounts)
+    results = {customer_id: {'payments': [], 'applied': 0, 'unallocated': amounts[customer_id] or 0}
+               for customer_id in customer_ids}
+    if not customer_ids:
+        return results
+
+    _lock_customers(customer_ids)
+    outstanding = unpaid_sales_query().filter(Sale.customer_id.in_(customer_ids)).order_by(
+        Sale.customer_id, Sale.sale_date, Sale.id
+    ).all()
+
+    payments = []
+    statuses = {}
+    left = dict(amounts)
+    for sale in outstanding:
+        available = left[sale.customer_id]
+        if available is not None and available <= 0:
+            continue
+
+        amount = sale.remaining_amount if available is None else min(available, sale.remaining_amount)
+        if available is not None:
+            left[sale.customer_id] = available - amount
+
+        payments.append(dict(sale_id=sale.id, amount=amount, payment_date=now,
+                             payment_method=payment_method, notes=notes, user_id=user_id))
+        statuses[sale.id] = 'paid' if amount >= sale.remaining_amount else 'partial'
+
+        result = results[sale.customer_id]
+        result['payments'].append({'sale_id': sale.id, 'amount': amount})
+        result['applied'] += amount
+
+    if not payments:
+        return results
+
+    for customer_id, result in results.items():
+        result['unallocated'] = left[customer_id] or 0
+
+    sale_table = Sale.__table__
+    db.session.execute(insert(Payment), payments)
+    db.session.execute(sale_table.update().where(sale_table.c.id.in_(sorted(statuses))).values(
+        payment_status=case(statuses, value=sale_table.c.id)
+    ))
+    record_payments(payments)
+    adjust_customer_balances({customer_id: -result['applied'] for customer_id, result in results.items()
+                              if result['applied']}, now)
+    return results
+
+
+def pay_all_debts(customer_ids, user_id, payment_method='نقدي', notes=None):
+    """تسديد كل ديون العملاء المحددين، PAYMENT_BATCH_SIZE عميل في كل معاملة
+
+    ترجع dict فيه customers_paid و payments_count و total_amount. إذا فشلت
+    معاملة يُتراجع عنها وحدها وترفع PaymentBatchFailed بما حُفظ قبلها.
+    """
+    customer_ids = sorted(set(customer_ids))
+    totals = {'customers_paid': 0, 'payments_count': 0, 'total_amount': 0}
+    for start in range(0, len(customer_ids), PAYMENT_BATCH_SIZE):
+        batch = customer_ids[start:start + PAYMENT_BATCH_SIZE]
+        try:
+            results = allocate_payments(dict.fromkeys(batch), user_id, payment_method, notes)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise PaymentBatchFailed(e, totals) from e
+        for result in results.values():
+            if result['payments']:
+                totals['customers_paid'] += 1
+                totals['payments_count'] += len(result['payments'])
+                totals['total_amount'] += result['applied']
+    return totals
@@ -0,0 +1,138 @@
+"""
+Incremental (delta) sync of products, categories and customers for offline tills
+
+A client sends the cursor it received last time as ``?since=<cursor>`` and
+gets back only the rows whose ``updated_at`` is newer, the ids deleted since
+then and the next cursor. Deletions are recorded in ``sync_tombstone`` by the
+``after_delete`` mapper events below, so they are seen no matter which view
+deleted the row.
+
+A product is sent with its category's name and a category with its product
+count, so the mapper events below also touch ``updated_at`` on the other side:
+renaming a category touches its products, and adding, deleting or moving a
+product touches the categories involved.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+
+from metrics import record_sync_batch
+from models import db, Product, Category, Customer, SyncTombstone
+
+
+# الصفوف المعدلة خلال هذه المدة قبل المؤشر تُرسل مرة أخرى، حتى لا تضيع
+# تعديلات معاملة بدأت قبل إصدار المؤشر ولم تكتمل إلا بعده
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+# سجلات الحذف الأقدم من هذه المدة يمكن حذفها؛ العميل الذي يملك مؤشراً أقدم
+# منها يحصل على نسخة كاملة
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+SYNC_ENTITIES = {
+    Product: 'product',
+    Category: 'category',
+    Customer: 'customer',
+}
+
+
+def _record_tombstone(mapper, connection, target):
+    connection.execute(SyncTombstone.__table__.insert().values(
+        entity=SYNC_ENTITIES[mapper.class_],
+        entity_id=target.id,
+        deleted_at=datetime.utcnow()
+    ))
+
+
+for _model in SYNC_ENTITIES:
+    event.listen(_model, 'after_delete', _record_tombstone)
+
+
+def touch_categories(connection, category_ids):
+    """تحديث updated_at للفئات حتى يصل عدد منتجاتها الجديد في المزامنة التالية"""
+    category_ids = {category_id for category_id in category_ids if category_id is not None}
+    if category_ids:
+        table = Category.__table__
+        connection.execute(table.update().where(table.c.id.in_(category_ids)).values(updated_at=datetime.utcnow()))
+
+
+@event.listens_for(Category, 'after_update')
+def _touch_category_products(mapper, connection, target):
+    # اسم الفئة جزء من بيانات كل منتج فيها
+    if inspect(target).attrs.name_ar.history.has_changes():
+        table = Product.__table__
+        connection.execute(table.update().where(table.c.category_id == target.id).values(updated_at=datetime.utcnow()))
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_delete')
+def _touch_product_category(mapper, connection, target):
+    touch_categories(connection, [target.category_id])
+
+
+@event.listens_for(Product, 'after_update')
+def _touch_moved_product_categories(mapper, connection, target):
+    history = inspect(target).attrs.category_id.history
+    if history.has_changes():
+        touch_categories(connection, list(history.deleted) + list(history.added))
+
+
+def parse_cursor(value):
+    """تحويل المؤشر (تاريخ ISO بتوقيت UTC) إلى datetime، أو None إذا كان فارغاً أو غير صالح"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class Delta:
+    """نتيجة المزامنة التزايدية لجدول واحد"""
+
+    def __init__(self, items, deleted, cursor, full):
+        self.items = items
+        self.deleted = deleted
+        self.cursor = cursor
+        self.full = full
+
+    def to_dict(self, serialize):
+        return {
+            'items': [serialize(item) for item in self.items],
+            'deleted': self.deleted,
+            'cursor': self.cursor,
+            'full': self.full,
+        }
+
+
+def collect_changes(model, since, query=None):
+    """الصفوف المعدلة والمحذوفة من model منذ المؤشر since
+
+    إذا كان since فارغاً أو أقدم من مدة الاحتفاظ بسجلات الحذف ترجع جميع
+    الصفوف مع full=True، ويجب على العميل استبدال بياناته المحلية بها.
+    """
+    now = datetime.utcnow()
+    since = parse_cursor(since)
+    query = query if query is not None else model.query
+    full = since is None or since < now - TOMBSTONE_RETENTION
+
+    if full:
+        deleted = []
+    else:
+        query = query.filter(model.updated_at > since)
+        deleted = [entity_id for (entity_id,) in db.session.query(SyncTombstone.entity_id).filter(
+            SyncTombstone.entity == SYNC_ENTITIES[model],
+            SyncTombstone.deleted_at > since
+        )]
+
+    items = query.all()
+    record_sync_batch('download', SYNC_ENTITIES[model], len(items) + len(deleted))
+    return Delta(items, deleted, (now - CURSOR_OVERLAP).isoformat(), full)
+
+
+def prune_tombstones():
+    """حذف سجلات الحذف الأقدم من مدة الاحتفاظ. ترجع عدد الصفوف المحذوفة"""
+    cutoff = datetime.utcnow() - TOMBSTONE_RETENTION
+    deleted = SyncTombstone.query.filter(SyncTombstone.deleted_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
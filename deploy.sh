@@ -78,6 +78,7 @@ if [ ! -f ".env" ]; then
     print_warning "- Set SECRET_KEY to a secure random string"
     print_warning "- Configure database credentials"
     print_warning "- Set up email settings for password reset"
+    print_warning "- Set METRICS_TOKEN to enable /metrics for Prometheus (scraped with Authorization: Bearer <token>)"
 fi
 
 # Create uploads directory
@@ -135,6 +136,12 @@ accesslog = "/var/www/library-management/logs/gunicorn_access.log"
 errorlog = "/var/www/library-management/logs/gunicorn_error.log"
 loglevel = "info"
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
+
+# Prometheus metrics of all workers are summed from PROMETHEUS_MULTIPROC_DIR;
+# drop the gauges of a worker when it exits
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
 EOF
 
 # Create systemd service
@@ -151,6 +158,10 @@ Group=$SERVICE_USER
 WorkingDirectory=$PROJECT_DIR
 Environment=PATH=$VENV_DIR/bin
 Environment=FLASK_CONFIG=vps
+# Created empty on every start (and removed on stop) for the workers' metrics files.
+# /metrics itself stays disabled until METRICS_TOKEN is set in .env
+RuntimeDirectory=library-management-metrics
+Environment=PROMETHEUS_MULTIPROC_DIR=/run/library-management-metrics
 ExecStart=$VENV_DIR/bin/gunicorn --config gunicorn.conf.py wsgi:application
 ExecReload=/bin/kill -s HUP \$MAINPID
 Restart=always
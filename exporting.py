@@ -0,0 +1,388 @@
+"""
+Streaming exports
+
+Export endpoints read their rows with ``yield_per`` (a server-side cursor
+where the driver supports one) and write the response while iterating, so a
+worker never holds a whole table in memory and the client starts receiving
+data immediately.
+
+The full-database export is written as NDJSON: one ``{"table": ..., "row":
+...}`` object per line and a final ``{"complete": true}`` line, or as a zip
+streamed entry by entry with one ``<table>.ndjson`` file per table.
+
+XLSX exports use openpyxl's ``write_only`` mode, which spools each row to a
+temporary file as it is appended, so building a sheet of any size takes
+constant memory. The finished file is sent from disk in chunks.
+
+Exports too slow for one request (the full database as a zip, a long period
+of sales as XLSX) also run as background jobs that write the same file to
+disk for a later download (see ``jobs``).
+"""
+
+import io
+import json
+import tempfile
+import zipfile
+from datetime import datetime
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+from sqlalchemy import func
+
+from models import db, Product, Category, Customer, Sale, SaleItem, Payment, Expense, User
+from reporting import within_days
+
+
+# عدد الصفوف التي تُقرأ من قاعدة البيانات في كل دفعة
+EXPORT_BATCH_SIZE = 500
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def stream_json_array(items):
+    """كتابة items كمصفوفة JSON عنصراً عنصراً بدلاً من بنائها في الذاكرة"""
+    yield '['
+    for index, item in enumerate(items):
+        yield (',\n' if index else '\n') + json.dumps(item, ensure_ascii=False)
+    yield '\n]\n'
+
+
+def _stock_status(stock):
+    if stock <= 0:
+        return 'نفدت الكمية', 'Out of Stock'
+    if stock <= 10:
+        return 'كمية قليلة', 'Low Stock'
+    return 'متوفر', 'Available'
+
+
+def inventory_rows():
+    """صفوف تقرير المخزون مع إجمالي مبيعات كل منتج
+
+    المبيعات مجمعة مرة واحدة لكل منتج (GROUP BY على sale_item) ومربوطة
+    بالمنتجات بـ LEFT JOIN، فالتقرير كله استعلام واحد مهما كان عدد المنتجات.
+    """
+    sold = db.session.query(
+        SaleItem.product_id.label('product_id'),
+        func.sum(SaleItem.quantity).label('total_sold'),
+        func.sum(SaleItem.total_price).label('total_revenue')
+    ).group_by(SaleItem.product_id).subquery()
+
+    rows = db.session.query(
+        Product.id, Product.name_ar, Product.stock_quantity, Product.unit_type, Product.price,
+        Category.name_ar.label('category_name'),
+        func.coalesce(sold.c.total_sold, 0).label('total_sold'),
+        func.coalesce(sold.c.total_revenue, 0).label('total_revenue')
+    ).join(Category, Category.id == Product.category_id).outerjoin(
+        sold, sold.c.product_id == Product.id
+    ).order_by(Product.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    for row in rows:
+        stock = float(row.stock_quantity or 0)
+        price = float(row.price or 0)
+        status, status_en = _stock_status(stock)
+        yield {
+            'product_id': row.id,
+            'product_name': row.name_ar,
+            'category': row.category_name or 'غير محدد',
+            'current_stock': stock,
+            'unit_type': row.unit_type,
+            'unit_price': price,
+            'stock_value': stock * price,
+            'is_whole_unit': row.unit_type == 'كامل',
+            'status_ar': status,
+            'status_en': status_en,
+            'total_sold': float(row.total_sold),
+            'total_revenue': float(row.total_revenue)
+        }
+
+
+def _batched(query, *order_by):
+    """قراءة الاستعلام على دفعات بدلاً من تحميله كاملاً"""
+    return query.order_by(*order_by).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+def _table_rows(model):
+    """أعمدة الجدول كصفوف بسيطة (بدون كائنات ORM ولا علاقاتها)"""
+    return db.session.query(*model.__table__.columns)
+
+
+def _report_summary():
+    products, customers, sales, categories = db.session.query(
+        db.session.query(func.count(Product.id)).scalar_subquery(),
+        db.session.query(func.count(Customer.id)).scalar_subquery(),
+        db.session.query(func.count(Sale.id)).scalar_subquery(),
+        db.session.query(func.count(Category.id)).scalar_subquery()
+    ).one()
+    yield {
+        'تاريخ التقرير': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'عدد المنتجات': products,
+        'عدد العملاء': customers,
+        'عدد المبيعات': sales,
+        'عدد الفئات': categories
+    }
+
+
+def _products():
+    for p in _batched(_table_rows(Product), Product.id):
+        yield {
+            'رقم المنتج': p.id,
+            'اسم المنتج': p.name_ar,
+            'سعر الجملة': float(p.wholesale_price or 0),
+            'سعر البيع': float(p.retail_price or 0),
+            'الكمية': float(p.stock_quantity or 0),
+            'نوع الوحدة': p.unit_type,
+            'الحد الأدنى': float(p.min_stock_threshold or 0)
+        }
+
+
+def _categories():
+    for c in _batched(_table_rows(Category), Category.id):
+        yield {
+            'رقم الفئة': c.id,
+            'اسم الفئة': c.name_ar,
+            'الوصف': c.description_ar or ''
+        }
+
+
+def _customers():
+    for c in _batched(_table_rows(Customer), Customer.id):
+        yield {
+            'رقم العميل': c.id,
+            'اسم العميل': c.name,
+            'الهاتف': c.phone or '',
+            'العنوان': c.address or '',
+            'ملاحظات': c.notes or ''
+        }
+
+
+def _item_unit_cost():
+    # مثل SaleItem.effective_unit_cost: سعر الجملة الحالي للأصناف القديمة بدون unit_cost
+    return func.coalesce(SaleItem.unit_cost, Product.wholesale_price)
+
+
+def _sales():
+    # التكلفة والربح لكل بيع مجمعة في استعلام فرعي مربوط بـ LEFT JOIN
+    unit_cost = _item_unit_cost()
+    costs = db.session.query(
+        SaleItem.sale_id.label('sale_id'),
+        func.sum(unit_cost * SaleItem.quantity).label('cost'),
+        func.sum((SaleItem.unit_price - unit_cost) * SaleItem.quantity).label('profit')
+    ).outerjoin(Product, Product.id == SaleItem.product_id).group_by(SaleItem.sale_id).subquery()
+
+    rows = db.session.query(
+        Sale.id, Sale.sale_date, Sale.total_amount, Sale.payment_type, Sale.payment_status, Sale.notes,
+        costs.c.cost, costs.c.profit
+    ).outerjoin(costs, costs.c.sale_id == Sale.id)
+
+    for s in _batched(rows, Sale.id):
+        yield {
+            'رقم البيع': s.id,
+            'تاريخ البيع': str(s.sale_date),
+            'المبلغ': float(s.total_amount),
+            'التكلفة': float(s.cost or 0),
+            'الربح': float(s.profit or 0),
+            'نوع الدفع': s.payment_type,
+            'حالة الدفع': s.payment_status,
+            'ملاحظات': s.notes or ''
+        }
+
+
+def _sale_items():
+    rows = db.session.query(
+        SaleItem.id, SaleItem.sale_id, SaleItem.product_id, SaleItem.quantity, SaleItem.unit_price,
+        SaleItem.total_price, _item_unit_cost().label('unit_cost')
+    ).outerjoin(Product, Product.id == SaleItem.product_id)
+
+    for si in _batched(rows, SaleItem.id):
+        yield {
+            'رقم البيع': si.sale_id,
+            'رقم المنتج': si.product_id,
+            'الكمية': float(si.quantity),
+            'سعر الوحدة': float(si.unit_price),
+            'سعر الجملة': float(si.unit_cost or 0),
+            'الإجمالي': float(si.total_price)
+        }
+
+
+def _payments():
+    for p in _batched(_table_rows(Payment), Payment.id):
+        yield {
+            'رقم الدفعة': p.id,
+            'رقم البيع': p.sale_id,
+            'المبلغ': float(p.amount),
+            'تاريخ الدفع': str(p.payment_date),
+            'طريقة الدفع': p.payment_method,
+            'ملاحظات': p.notes or ''
+        }
+
+
+def _expenses():
+    for e in _batched(_table_rows(Expense), Expense.id):
+        yield {
+            'رقم المصروف': e.id,
+            'الوصف': e.description,
+            'المبلغ': float(e.amount),
+            'النوع': e.expense_type,
+            'التاريخ': str(e.expense_date),
+            'ملاحظات': e.notes or ''
+        }
+
+
+def _users():
+    for u in _batched(_table_rows(User), User.id):
+        yield {
+            'رقم المستخدم': u.id,
+            'اسم المستخدم': u.username,
+            'الدور': u.role,
+            'تاريخ الإنشاء': str(u.created_at)
+        }
+
+
+def full_export_tables(include_users=False):
+    """جداول التصدير الكامل بالترتيب: قائمة (اسم الجدول، دالة ترجع مولد الصفوف)"""
+    tables = [
+        ('report_summary', _report_summary),
+        ('products', _products),
+        ('categories', _categories),
+        ('customers', _customers),
+        ('sales', _sales),
+        ('sale_items', _sale_items),
+        ('payments', _payments),
+        ('expenses', _expenses),
+    ]
+    if include_users:
+        tables.append(('users', _users))
+    return tables
+
+
+def stream_ndjson(tables):
+    """التصدير الكامل كسطور NDJSON، جدولاً بعد جدول"""
+    for name, rows in tables:
+        for row in rows():
+            yield json.dumps({'table': name, 'row': row}, ensure_ascii=False) + '\n'
+    # العميل يعرف من هذا السطر أن التصدير لم ينقطع في المنتصف
+    yield json.dumps({'complete': True}) + '\n'
+
+
+class _ChunkWriter(io.RawIOBase):
+    """ملف للكتابة فقط يجمع ما يكتبه zipfile حتى يُرسل للعميل"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(tables):
+    """التصدير الكامل كملف zip يُرسل أثناء كتابته (ملف <table>.ndjson لكل جدول)"""
+    output = _ChunkWriter()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, rows in tables:
+            with archive.open(f'{name}.ndjson', 'w', force_zip64=True) as entry:
+                for index, row in enumerate(rows(), 1):
+                    entry.write((json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8'))
+                    if index % EXPORT_BATCH_SIZE == 0:
+                        yield output.drain()
+            yield output.drain()
+    yield output.drain()
+
+
+def export_database_file(progress, include_users=False):
+    """مهمة التصدير الكامل كملف zip على القرص. ترجع اسم ملف التنزيل"""
+    tables = full_export_tables(include_users)
+
+    def with_progress(index, name, rows):
+        def rows_with_progress():
+            progress(index * 100.0 / len(tables), f'جاري تصدير {name}')
+            return rows()
+        return rows_with_progress
+
+    tracked = [(name, with_progress(index, name, rows)) for index, (name, rows) in enumerate(tables)]
+    with open(progress.output_path(), 'wb') as output:
+        for chunk in stream_zip(tracked):
+            output.write(chunk)
+    return {'filename': f"norko_database_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.zip"}
+
+
+def write_xlsx(title, headers, rows, column_widths=None, path=None):
+    """بناء ملف xlsx من الصفوف بوضع write_only
+
+    يُحفظ في path إن مُرر، وإلا ترجع ملفاً مؤقتاً مفتوحاً على بدايته، جاهزاً
+    للإرسال بـ send_file.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.sheet_view.rightToLeft = True
+    sheet.freeze_panes = 'A2'
+    for col_num, width in enumerate(column_widths or [], 1):
+        sheet.column_dimensions[get_column_letter(col_num)].width = width
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+        header_cells.append(cell)
+    sheet.append(header_cells)
+
+    for row in rows:
+        sheet.append(row)
+
+    if path:
+        workbook.save(path)
+        return path
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def sale_item_lines(start_day=None, end_day=None, user_id=None):
+    """أصناف المبيعات مع بيانات البيع والبائع والمنتج والفئة في استعلام JOIN واحد
+
+    التكلفة والربح محسوبان في الاستعلام (سعر الجملة الحالي للأصناف القديمة
+    بدون unit_cost، كما في SaleItem.effective_unit_cost). مرتبة من الأحدث،
+    وتُقرأ على دفعات. user_id يقصر النتيجة على مبيعات بائع واحد.
+    """
+    unit_cost = _item_unit_cost()
+    query = db.session.query(
+        Sale.id.label('sale_id'), Sale.sale_date, Sale.total_amount, Sale.notes,
+        User.username, User.role,
+        Product.name_ar.label('product_name'), Product.unit_type,
+        Category.name_ar.label('category_name'),
+        SaleItem.id, SaleItem.quantity, SaleItem.unit_price, SaleItem.total_price,
+        unit_cost.label('unit_cost'),
+        func.coalesce((SaleItem.unit_price - unit_cost) * SaleItem.quantity, 0).label('profit')
+    ).select_from(SaleItem).join(Sale, Sale.id == SaleItem.sale_id).join(
+        User, User.id == Sale.user_id
+    ).join(Product, Product.id == SaleItem.product_id).outerjoin(
+        Category, Category.id == Product.category_id
+    ).filter(within_days(Sale.sale_date, start_day, end_day))
+
+    if user_id is not None:
+        query = query.filter(Sale.user_id == user_id)
+
+    return _batched(query, Sale.sale_date.desc(), Sale.id.desc(), SaleItem.id)
+
+
+def product_lines():
+    """المنتجات مع أسماء فئاتها في استعلام واحد، مرتبة بالمعرف"""
+    query = db.session.query(
+        Product.id, Product.name_ar, Product.wholesale_price, Product.retail_price, Product.price,
+        Product.stock_quantity, Product.min_stock_threshold, Product.unit_type,
+        Category.name_ar.label('category_name')
+    ).outerjoin(Category, Category.id == Product.category_id)
+    return _batched(query, Product.id)
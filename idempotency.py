@@ -0,0 +1,71 @@
+"""
+Replay protection for sale uploads
+
+Clients retry uploads that timed out even though the server may already have
+committed them. Each write that carries a key (the ``Idempotency-Key`` header
+on ``/api/sales`` or the ``local_id`` of a sale sent to ``/api/sync``) stores
+its response in ``idempotency_key`` inside the same transaction as the sale.
+A replay is answered from that row with one lookup on the unique
+``(user_id, scope, key)`` index instead of writing the sale again.
+"""
+
+import json
+from datetime import datetime, timedelta
+
+from models import db, IdempotencyKey
+
+
+# المدة التي يمكن خلالها إعادة إرسال نفس الطلب
+IDEMPOTENCY_KEY_TTL = timedelta(days=7)
+
+SCOPE_SALE = 'sale'
+SCOPE_SYNC_SALE = 'sync_sale'
+
+
+def normalize_key(value):
+    """تحويل المفتاح إلى نص بطول مناسب، أو None إذا كان فارغاً"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value[:100] or None
+
+
+def stored_response(scope, user_id, key):
+    """الرد المحفوظ لمفتاح واحد كـ (body, status_code)، أو None"""
+    row = db.session.query(IdempotencyKey.response, IdempotencyKey.status_code).filter_by(
+        user_id=user_id, scope=scope, key=key
+    ).first()
+    return (json.loads(row.response), row.status_code) if row else None
+
+
+def stored_responses(scope, user_id, keys):
+    """الردود المحفوظة لعدة مفاتيح باستعلام IN واحد. ترجع dict: key -> body"""
+    keys = {key for key in keys if key is not None}
+    if not keys:
+        return {}
+    rows = db.session.query(IdempotencyKey.key, IdempotencyKey.response).filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.scope == scope,
+        IdempotencyKey.key.in_(keys)
+    )
+    return {key: json.loads(response) for key, response in rows}
+
+
+def remember_responses(scope, user_id, responses, status_code=200):
+    """حفظ الردود {key: body} داخل المعاملة الحالية (الاستدعاء يكون قبل commit)"""
+    if not responses:
+        return
+    now = datetime.utcnow()
+    db.session.execute(IdempotencyKey.__table__.insert(), [
+        dict(user_id=user_id, scope=scope, key=key, response=json.dumps(body),
+             status_code=status_code, created_at=now)
+        for key, body in responses.items()
+    ])
+
+
+def prune_idempotency_keys():
+    """حذف المفاتيح الأقدم من مدة الصلاحية. ترجع عدد الصفوف المحذوفة"""
+    cutoff = datetime.utcnow() - IDEMPOTENCY_KEY_TTL
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,153 @@
+"""
+Background jobs for slow admin tasks
+
+The request creates a ``job`` row and returns its id at once; the work runs
+on a small thread pool inside the worker process and writes its progress and
+result into that row. Any worker can then answer ``/api/jobs/<id>``, so the
+client may poll whichever worker the load balancer picks.
+
+Jobs that produce a file (exports) write it under ``UPLOAD_FOLDER/jobs`` and
+return its download name; ``/api/jobs/<id>/download`` sends it afterwards.
+Finished jobs and their files are removed by ``manage.py prune-jobs``.
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, url_for
+
+from models import db, Job
+
+
+# مدة الاحتفاظ بالمهام المنتهية وملفاتها
+JOB_RETENTION = timedelta(days=2)
+
+# مهمة لم تنته خلال هذه المدة توقفت مع عامل أُعيد تشغيله
+JOB_STALE_AFTER = timedelta(hours=6)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config.get('JOB_WORKERS', 2),
+                                           thread_name_prefix='job')
+        return _executor
+
+
+def _update_job(job_id, **values):
+    table = Job.__table__
+    db.session.execute(table.update().where(table.c.id == job_id).values(**values))
+    db.session.commit()
+
+
+def _files_folder(app):
+    return os.path.join(app.root_path, app.config.get('UPLOAD_FOLDER', 'uploads'), 'jobs')
+
+
+def job_file_path(job_id, app=None):
+    """مسار ملف ناتج المهمة (واحد لكل مهمة)"""
+    return os.path.join(_files_folder(app or current_app), f'job_{job_id}')
+
+
+class JobProgress:
+    """تُمرر لدالة المهمة لتسجيل نسبة الإنجاز
+
+    التسجيل ينفذ commit على جلسة المهمة، لذلك يُستدعى بين دفعات العمل
+    بعد حفظ كل دفعة.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def __call__(self, progress, message=None):
+        _update_job(self.job_id, progress=min(max(progress, 0), 100), message=message)
+
+    def output_path(self):
+        """مسار الملف الذي تكتب فيه المهمة ناتجها"""
+        os.makedirs(_files_folder(current_app), exist_ok=True)
+        return job_file_path(self.job_id)
+
+
+def _run_job(app, job_id, func, args, kwargs):
+    with app.app_context():
+        _update_job(job_id, status='running', started_at=datetime.utcnow())
+        try:
+            result = func(JobProgress(job_id), *args, **kwargs)
+        except Exception as e:
+            db.session.rollback()
+            logger.exception('Job %s failed', job_id)
+            _update_job(job_id, status='failed', message=str(e)[:300], finished_at=datetime.utcnow())
+        else:
+            _update_job(job_id, status='done', progress=100,
+                        result=json.dumps(result, ensure_ascii=False), finished_at=datetime.utcnow())
+
+
+def submit_job(kind, user_id, func, *args, **kwargs):
+    """إنشاء مهمة وتشغيل func(progress, *args, **kwargs) في الخلفية
+
+    قيمة func المرجعة تُحفظ كنتيجة المهمة (يجب أن تكون قابلة للتحويل إلى JSON).
+    المهام التي تكتب ملفاً في progress.output_path() ترجع اسم التنزيل في
+    المفتاح 'filename'. ترجع كائن Job.
+    """
+    job = Job(kind=kind, user_id=user_id)
+    db.session.add(job)
+    db.session.commit()
+    app = current_app._get_current_object()
+    _get_executor(app).submit(_run_job, app, job.id, func, args, kwargs)
+    return job
+
+
+def job_result(job):
+    return json.loads(job.result) if job.result else None
+
+
+def job_to_dict(job):
+    result = job_result(job)
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': result,
+        'download_url': url_for('api_job_download', job_id=job.id)
+                        if job.status == 'done' and result and result.get('filename') else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def prune_jobs():
+    """حذف المهام المنتهية الأقدم من مدة الاحتفاظ مع ملفاتها، وتعليم المهام
+    المتوقفة كفاشلة. ترجع (عدد المحذوف، عدد المتوقف)"""
+    now = datetime.utcnow()
+    stale = Job.query.filter(
+        Job.status.in_(['queued', 'running']),
+        Job.created_at < now - JOB_STALE_AFTER
+    ).update({'status': 'failed', 'message': 'توقفت المهمة قبل اكتمالها', 'finished_at': now},
+             synchronize_session=False)
+
+    old_ids = [job_id for job_id, in db.session.query(Job.id).filter(
+        Job.status.in_(['done', 'failed']),
+        Job.finished_at < now - JOB_RETENTION
+    )]
+    for job_id in old_ids:
+        path = job_file_path(job_id)
+        if os.path.exists(path):
+            os.remove(path)
+    if old_ids:
+        Job.query.filter(Job.id.in_(old_ids)).delete(synchronize_session=False)
+
+    db.session.commit()
+    return len(old_ids), stale
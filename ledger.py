@@ -0,0 +1,312 @@
+"""
+Bookkeeping that must run inside the same transaction as a sale, payment or return
+
+The write paths (api_create_sale, api_sync, add_payment, api_quick_payment and
+api_process_return) call these helpers before committing, so the
+pre-aggregated tables and the stored customer balances never drift from the
+rows they summarise.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, DailySalesSummary, Sale, SaleItem, Product, Payment, Return, Customer
+from reporting import parse_day
+
+
+SUMMARY_FIELDS = (
+    'sales_count', 'revenue', 'cost', 'profit', 'credit_sales_count',
+    'credit_amount', 'payments_amount', 'returns_count', 'returns_amount',
+)
+
+
+def _bump_daily_summary(day, user_id, **deltas):
+    """إضافة القيم إلى صف الملخص اليومي (day, user_id)، وإنشاؤه إذا لم يكن موجوداً"""
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    table = DailySalesSummary.__table__
+    now = datetime.utcnow()
+    increment = table.update().where(
+        table.c.day == day,
+        table.c.user_id == user_id
+    ).values(updated_at=now, **{name: table.c[name] + value for name, value in deltas.items()})
+
+    if db.session.execute(increment).rowcount:
+        return
+
+    try:
+        # savepoint: عاملان قد ينشئان نفس الصف في نفس اللحظة
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(day=day, user_id=user_id, updated_at=now, **deltas))
+    except IntegrityError:
+        db.session.execute(increment)
+
+
+def _sale_deltas(sale, sale_items):
+    is_credit = sale.payment_type == 'credit'
+    return dict(
+        sales_count=1,
+        revenue=sale.total_amount,
+        cost=sum(item.cost_amount for item in sale_items),
+        profit=sum(item.profit for item in sale_items),
+        credit_sales_count=1 if is_credit else 0,
+        credit_amount=sale.total_amount if is_credit else 0
+    )
+
+
+def record_sale(sale, sale_items):
+    """تسجيل بيع في الملخص اليومي
+
+    التكلفة والربح محسوبان من unit_cost المسجل على كل صنف وقت البيع.
+    يجب استدعاؤها بعد flush حتى يكون sale.sale_date محدداً.
+    """
+    _bump_daily_summary(sale.sale_date.date(), sale.user_id, **_sale_deltas(sale, sale_items))
+
+
+def record_sales(sales):
+    """تسجيل عدة مبيعات [(sale, sale_items), ...] بتحديث واحد لكل (يوم، بائع)"""
+    totals = defaultdict(lambda: defaultdict(int))
+    for sale, sale_items in sales:
+        row = totals[(sale.sale_date.date(), sale.user_id)]
+        for name, value in _sale_deltas(sale, sale_items).items():
+            row[name] += value
+
+    for (day, user_id), deltas in totals.items():
+        _bump_daily_summary(day, user_id, **deltas)
+
+
+def record_payment(payment):
+    """تسجيل دفعة في الملخص اليومي (يجب استدعاؤها بعد flush)"""
+    _bump_daily_summary(payment.payment_date.date(), payment.user_id,
+                        payments_amount=payment.amount)
+
+
+def record_payments(payments):
+    """تسجيل عدة دفعات (dicts فيها payment_date و user_id و amount) بتحديث واحد لكل (يوم، مستخدم)"""
+    totals = defaultdict(float)
+    for payment in payments:
+        totals[(payment['payment_date'].date(), payment['user_id'])] += payment['amount']
+
+    for (day, user_id), amount in totals.items():
+        _bump_daily_summary(day, user_id, payments_amount=amount)
+
+
+def record_return(return_obj):
+    """تسجيل مرتجع مقبول في الملخص اليومي بتاريخ المعالجة"""
+    _bump_daily_summary(return_obj.processed_date.date(), return_obj.user_id,
+                        returns_count=1, returns_amount=return_obj.total_amount)
+
+
+class InsufficientStock(ValueError):
+    """الكمية المطلوبة أكبر من المخزون الحالي للمنتج"""
+
+    def __init__(self, product_id):
+        super().__init__(f'الكمية المطلوبة غير متوفرة للمنتج رقم {product_id}')
+        self.product_id = product_id
+
+
+def decrement_stock(quantities, when=None):
+    """خصم الكميات {product_id: quantity} من المخزون ذرياً
+
+    الخصم يتم بـ UPDATE مشروط (stock_quantity >= الكمية) بدلاً من قراءة
+    المخزون ثم كتابته، فلا يمكن لبيعين متزامنين بيع نفس الكمية مرتين. الصفوف
+    تُقفل أولاً بترتيب معرفاتها (SELECT ... FOR UPDATE) حتى لا يحدث deadlock
+    بين معاملتين، ثم تُخصم كل المنتجات بجملة UPDATE واحدة ترجع المعرفات التي
+    تم خصمها. الاستدعاء يكون قبل commit مباشرة حتى تبقى الأقفال أقصر وقت
+    ممكن. إذا لم يكفِ المخزون ترفع InsufficientStock ويجب التراجع عن المعاملة.
+    """
+    if not quantities:
+        return
+
+    table = Product.__table__
+    now = when or datetime.utcnow()
+    product_ids = sorted(quantities)
+
+    if not db.session.get_bind().dialect.update_returning:
+        # قواعد بيانات لا تدعم UPDATE ... RETURNING: تحديث لكل منتج بنفس الترتيب
+        for product_id in product_ids:
+            result = db.session.execute(table.update().where(
+                table.c.id == product_id,
+                table.c.stock_quantity >= quantities[product_id]
+            ).values(stock_quantity=table.c.stock_quantity - quantities[product_id], updated_at=now))
+            if result.rowcount != 1:
+                raise InsufficientStock(product_id)
+        return
+
+    db.session.execute(
+        select(table.c.id).where(table.c.id.in_(product_ids)).order_by(table.c.id).with_for_update()
+    )
+    quantity = case(quantities, value=table.c.id)
+    updated = db.session.execute(table.update().where(
+        table.c.id.in_(product_ids),
+        table.c.stock_quantity >= quantity
+    ).values(stock_quantity=table.c.stock_quantity - quantity, updated_at=now).returning(table.c.id)).scalars()
+
+    missing = set(product_ids).difference(updated)
+    if missing:
+        raise InsufficientStock(min(missing))
+
+
+def adjust_customer_balance(customer_id, delta, when=None):
+    """تعديل رصيد العميل ذرياً (balance = balance + delta) وتحديث تاريخ آخر عملية"""
+    if not customer_id:
+        return
+
+    table = Customer.__table__
+    db.session.execute(table.update().where(table.c.id == customer_id).values(
+        balance=table.c.balance + delta,
+        last_activity_at=when or datetime.utcnow(),
+        updated_at=datetime.utcnow()
+    ))
+
+
+def adjust_customer_balances(deltas, when=None):
+    """تعديل أرصدة عدة عملاء {customer_id: delta} بجملة UPDATE واحدة"""
+    if not deltas:
+        return
+
+    table = Customer.__table__
+    db.session.execute(table.update().where(table.c.id.in_(sorted(deltas))).values(
+        balance=table.c.balance + case(deltas, value=table.c.id),
+        last_activity_at=when or datetime.utcnow(),
+        updated_at=datetime.utcnow()
+    ))
+
+
+def sale_opening_balance(sale, paid_amount=0):
+    """المبلغ الذي يضيفه البيع إلى دين العميل عند إنشائه"""
+    if sale.payment_type == 'cash' or sale.payment_status == 'paid':
+        return 0
+    return max(0, sale.total_amount - paid_amount)
+
+
+def outstanding_by_customer():
+    """الدين الفعلي لكل عميل محسوباً من المبيعات والدفعات (استعلام واحد)
+
+    الدين = مجموع المتبقي من كل بيع آجل غير مدفوع بالكامل، وهو نفس حساب
+    Sale.remaining_amount. ترجع dict: customer_id -> الدين.
+    """
+    paid = db.session.query(
+        Payment.sale_id.label('sale_id'),
+        func.sum(Payment.amount).label('paid')
+    ).group_by(Payment.sale_id).subquery()
+
+    remaining = Sale.total_amount - func.coalesce(paid.c.paid, 0)
+    rows = db.session.query(
+        Sale.customer_id,
+        func.sum(case((remaining > 0, remaining), else_=0))
+    ).outerjoin(paid, paid.c.sale_id == Sale.id).filter(
+        Sale.customer_id.isnot(None),
+        Sale.payment_type != 'cash',
+        Sale.payment_status != 'paid'
+    ).group_by(Sale.customer_id)
+
+    return {customer_id: float(debt or 0) for customer_id, debt in rows}
+
+
+def last_activity_by_customer():
+    """تاريخ آخر بيع أو دفعة لكل عميل. ترجع dict: customer_id -> datetime"""
+    activity = {}
+    sales = db.session.query(Sale.customer_id, func.max(Sale.sale_date)).filter(
+        Sale.customer_id.isnot(None)
+    ).group_by(Sale.customer_id)
+    payments = db.session.query(Sale.customer_id, func.max(Payment.payment_date)).join(
+        Payment, Payment.sale_id == Sale.id
+    ).filter(Sale.customer_id.isnot(None)).group_by(Sale.customer_id)
+
+    for customer_id, when in list(sales) + list(payments):
+        if when is not None and (customer_id not in activity or when > activity[customer_id]):
+            activity[customer_id] = when
+    return activity
+
+
+def reconcile_customer_balances(fix=False, tolerance=0.005):
+    """مقارنة الرصيد المخزن لكل عميل بالدين الفعلي
+
+    ترجع قائمة (customer, الرصيد المخزن، الدين الفعلي) للعملاء المختلفين.
+    إذا كان fix=True يتم تصحيح الرصيد وتاريخ آخر عملية لجميع العملاء.
+    """
+    actual = outstanding_by_customer()
+    activity = last_activity_by_customer()
+    mismatches = []
+
+    for customer in Customer.query.order_by(Customer.id):
+        expected = actual.get(customer.id, 0)
+        stored = customer.balance or 0
+        if abs(stored - expected) > tolerance:
+            mismatches.append((customer, stored, expected))
+        if fix:
+            customer.balance = expected
+            customer.last_activity_at = activity.get(customer.id, customer.last_activity_at)
+
+    if fix:
+        db.session.commit()
+    return mismatches
+
+
+def backfill_unit_costs():
+    """تعبئة unit_cost للأصناف القديمة من سعر الجملة الحالي للمنتج. ترجع عدد الصفوف"""
+    wholesale_price = db.session.query(Product.wholesale_price).filter(
+        Product.id == SaleItem.product_id
+    ).scalar_subquery()
+    result = db.session.execute(
+        SaleItem.__table__.update().where(SaleItem.unit_cost.is_(None)).values(unit_cost=wholesale_price)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def rebuild_daily_summary():
+    """إعادة بناء جدول الملخص اليومي بالكامل من جداول المبيعات والدفعات والمرتجعات
+
+    يتم الحذف والإدراج داخل معاملة واحدة. ترجع عدد الصفوف المنشأة.
+    """
+    rows = defaultdict(lambda: dict.fromkeys(SUMMARY_FIELDS, 0))
+
+    sale_day = func.date(Sale.sale_date)
+    for day, user_id, count, revenue, credit_count, credit_amount in db.session.query(
+        sale_day, Sale.user_id,
+        func.count(Sale.id),
+        func.sum(Sale.total_amount),
+        func.sum(case((Sale.payment_type == 'credit', 1), else_=0)),
+        func.sum(case((Sale.payment_type == 'credit', Sale.total_amount), else_=0))
+    ).group_by(sale_day, Sale.user_id):
+        row = rows[(parse_day(day), user_id)]
+        row.update(sales_count=count, revenue=revenue or 0,
+                   credit_sales_count=credit_count or 0, credit_amount=credit_amount or 0)
+
+    for day, user_id, cost, profit in db.session.query(
+        sale_day, Sale.user_id,
+        func.sum(SaleItem.unit_cost * SaleItem.quantity),
+        func.sum((SaleItem.unit_price - SaleItem.unit_cost) * SaleItem.quantity)
+    ).select_from(SaleItem).join(Sale).group_by(sale_day, Sale.user_id):
+        row = rows[(parse_day(day), user_id)]
+        row.update(cost=cost or 0, profit=profit or 0)
+
+    payment_day = func.date(Payment.payment_date)
+    for day, user_id, amount in db.session.query(
+        payment_day, Payment.user_id, func.sum(Payment.amount)
+    ).group_by(payment_day, Payment.user_id):
+        rows[(parse_day(day), user_id)]['payments_amount'] = amount or 0
+
+    processed_day = func.date(Return.processed_date)
+    for day, user_id, count, amount in db.session.query(
+        processed_day, Return.user_id, func.count(Return.id), func.sum(Return.total_amount)
+    ).filter(Return.status == 'approved', Return.processed_date.isnot(None)).group_by(processed_day, Return.user_id):
+        row = rows[(parse_day(day), user_id)]
+        row.update(returns_count=count, returns_amount=amount or 0)
+
+    now = datetime.utcnow()
+    db.session.query(DailySalesSummary).delete(synchronize_session=False)
+    if rows:
+        db.session.execute(DailySalesSummary.__table__.insert(), [
+            dict(day=day, user_id=user_id, updated_at=now, **values)
+            for (day, user_id), values in rows.items()
+        ])
+    db.session.commit()
+    return len(rows)
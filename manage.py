@@ -17,7 +17,12 @@ sys.path.insert(0, project_dir)
 os.environ.setdefault('FLASK_CONFIG', 'vps')
 
 from app import app
-from models import db, User, Product, Sale, Customer, Category, Expense, Payment
+from models import db, User, Product, Sale, Customer, Category, Expense, Payment, DailySalesSummary
+from ledger import rebuild_daily_summary, reconcile_customer_balances, backfill_unit_costs
+from delta_sync import prune_tombstones as prune_sync_tombstones, TOMBSTONE_RETENTION
+from idempotency import prune_idempotency_keys as prune_stored_responses, IDEMPOTENCY_KEY_TTL
+from jobs import prune_jobs as prune_finished_jobs, JOB_RETENTION
+from product_search import rebuild_search_keys, create_search_index
 
 
 @click.group()
@@ -218,6 +223,156 @@ def init_db():
         click.echo("✅ Database initialized successfully!")
 
 
+def _add_missing_columns(inspector):
+    """Add columns defined on the models but missing from existing tables"""
+    from sqlalchemy import literal, text
+
+    dialect = db.engine.dialect
+    quote = dialect.identifier_preparer.quote
+    added = []
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=dialect)}"
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                ddl += " DEFAULT " + str(literal(default).compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+                if not column.nullable:
+                    ddl += " NOT NULL"
+
+            db.session.execute(text(ddl))
+            added.append((table.name, column.name))
+            click.echo(f"➕ Added column {table.name}.{column.name}")
+
+    db.session.commit()
+    return added
+
+
+@cli.command()
+def upgrade_db():
+    """Apply schema upgrades (new tables, columns and indexes) to an existing database"""
+    with app.app_context():
+        # create_all() only creates missing tables; columns and indexes added
+        # to models later must be created explicitly on tables that already exist
+        db.create_all()
+
+        inspector = db.inspect(db.engine)
+        added_columns = _add_missing_columns(inspector)
+
+        created = 0
+        for table in db.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda ix: ix.name):
+                if index.name in existing:
+                    continue
+                index.create(bind=db.engine)
+                created += 1
+                click.echo(f"➕ Created index {index.name} on {table.name}")
+
+        # تثبيت تكلفة الأصناف القديمة قبل بناء الملخص اليومي
+        if ('sale_item', 'unit_cost') in added_columns:
+            rows = backfill_unit_costs()
+            click.echo(f"➕ Backfilled unit cost for {rows} sale items")
+
+        # تعبئة جدول الملخص اليومي عند إنشائه لأول مرة على قاعدة بيانات قائمة
+        if not DailySalesSummary.query.first() and Sale.query.first():
+            rows = rebuild_daily_summary()
+            click.echo(f"➕ Built daily sales summary ({rows} rows)")
+
+        # حساب أرصدة العملاء عند إضافة عمود الرصيد لأول مرة
+        if ('customer', 'balance') in added_columns:
+            reconcile_customer_balances(fix=True)
+            click.echo("➕ Calculated customer balances")
+
+        # تاريخ آخر تعديل للصفوف القديمة = تاريخ إنشائها
+        for model in (Category, Customer):
+            if (model.__tablename__, 'updated_at') in added_columns:
+                model.query.filter(model.updated_at.is_(None)).update(
+                    {model.updated_at: model.created_at}, synchronize_session=False)
+                db.session.commit()
+
+        # مفتاح البحث للمنتجات القديمة ثم فهرس البحث (ينشأ مع الجدول في القواعد الجديدة)
+        if ('product', 'search_key') in added_columns:
+            rows = rebuild_search_keys()
+            click.echo(f"➕ Built search keys for {rows} products")
+        with db.engine.begin() as connection:
+            create_search_index(connection)
+
+        click.echo(f"✅ Schema is up to date ({len(added_columns)} columns added, {created} indexes created)")
+
+
+@cli.command()
+def rebuild_sales_summary():
+    """Rebuild the daily sales summary table from sales, payments and returns"""
+    with app.app_context():
+        try:
+            rows = rebuild_daily_summary()
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"❌ Error rebuilding daily sales summary: {str(e)}")
+            return
+
+        click.echo(f"✅ Daily sales summary rebuilt ({rows} rows)")
+
+
+@cli.command()
+@click.option('--fix', is_flag=True, help='Repair stored balances that do not match')
+def reconcile_balances(fix):
+    """Verify stored customer balances against sales and payments"""
+    with app.app_context():
+        try:
+            mismatches = reconcile_customer_balances(fix=fix)
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"❌ Error reconciling balances: {str(e)}")
+            return
+
+        if not mismatches:
+            click.echo("✅ All customer balances are consistent")
+            return
+
+        click.echo(f"\n⚠️  {len(mismatches)} customer balances do not match:")
+        click.echo("-" * 70)
+        click.echo(f"{'ID':<8} {'Customer':<30} {'Stored':>14} {'Actual':>14}")
+        click.echo("-" * 70)
+        for customer, stored, actual in mismatches:
+            click.echo(f"{customer.id:<8} {customer.name[:30]:<30} {stored:>14.2f} {actual:>14.2f}")
+
+        if fix:
+            click.echo("✅ Balances repaired")
+        else:
+            click.echo("Run with --fix to repair them.")
+
+
+@cli.command()
+def prune_tombstones():
+    """Remove deletion records older than the offline delta sync retention"""
+    with app.app_context():
+        removed = prune_sync_tombstones()
+        click.echo(f"✅ Removed {removed} deletion records older than {TOMBSTONE_RETENTION.days} days")
+
+
+@cli.command()
+def prune_idempotency_keys():
+    """Remove stored sale upload results older than the replay window"""
+    with app.app_context():
+        removed = prune_stored_responses()
+        click.echo(f"✅ Removed {removed} idempotency keys older than {IDEMPOTENCY_KEY_TTL.days} days")
+
+
+@cli.command()
+def prune_jobs():
+    """Remove finished background jobs and their files after the retention period"""
+    with app.app_context():
+        removed, stale = prune_finished_jobs()
+        click.echo(f"✅ Removed {removed} jobs older than {JOB_RETENTION.days} days")
+        if stale:
+            click.echo(f"⚠️ Marked {stale} interrupted jobs as failed")
+
+
 @cli.command()
 @click.confirmation_option(prompt='Are you sure you want to reset the database? This will delete all data!')
 def reset_db():
@@ -0,0 +1,112 @@
+"""
+Prometheus metrics (``/metrics``)
+
+Request counts, latencies and server errors are recorded per Flask endpoint;
+the SQLAlchemy pool reports its checked-out connections and how many of them
+are beyond the configured pool size (the overflow); named ``TTLCache``
+instances count their hits and misses; and offline sync records how many rows
+each upload and delta pull carries, which is the backlog a till sends or
+receives when it reconnects.
+
+Under gunicorn every worker is a separate process. When the
+``PROMETHEUS_MULTIPROC_DIR`` environment variable points at a local
+directory (empty at startup, writable by the workers) each worker writes its
+values there and ``/metrics`` answers with the sum over all workers, whichever
+worker serves the scrape. gunicorn's ``child_exit`` hook must call
+``mark_process_dead`` so the pool gauges of dead workers are dropped (see
+``deploy.sh``). Without the variable only the serving process is reported.
+"""
+
+import os
+import threading
+import time
+
+from flask import g, request
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+
+# حدود فئات زمن الاستجابة بالثواني
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# حدود فئات عدد الصفوف في كل رفع أو تحميل للمزامنة
+SYNC_BATCH_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests', ['method', 'endpoint', 'status'])
+REQUEST_ERRORS = Counter('http_request_errors_total', 'HTTP requests answered with a 5xx status', ['method', 'endpoint'])
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time to build the response', ['method', 'endpoint'],
+                            buckets=LATENCY_BUCKETS)
+
+DB_POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections currently checked out of the SQLAlchemy pool',
+                            multiprocess_mode='livesum')
+DB_POOL_OVERFLOW = Gauge('db_pool_overflow', 'Checked-out connections beyond the pool size',
+                         multiprocess_mode='livesum')
+
+CACHE_LOOKUPS = Counter('cache_lookups_total', 'In-process cache lookups', ['cache', 'result'])
+
+SYNC_BATCH_SIZE = Histogram('sync_batch_rows', 'Rows per offline sync upload or delta pull', ['direction', 'entity'],
+                            buckets=SYNC_BATCH_BUCKETS)
+
+
+def record_cache_lookup(cache_name, hit):
+    CACHE_LOOKUPS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def record_sync_batch(direction, entity, rows):
+    """direction: 'upload' أو 'download'"""
+    SYNC_BATCH_SIZE.labels(direction, entity).observe(rows)
+
+
+def init_metrics(app, db):
+    """تسجيل معالجات قياس الطلبات ومراقبة مجمع الاتصالات"""
+
+    @app.before_request
+    def _start_metrics_timer():
+        g.metrics_started_at = time.perf_counter()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        endpoint = request.endpoint or 'unmatched'
+        REQUESTS.labels(request.method, endpoint, response.status_code).inc()
+        if response.status_code >= 500:
+            REQUEST_ERRORS.labels(request.method, endpoint).inc()
+        if 'metrics_started_at' in g:
+            REQUEST_LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - g.metrics_started_at)
+        return response
+
+    with app.app_context():
+        engine = db.engine
+
+    # العد في الأحداث نفسها: عند checkin لم يُرجع الاتصال للمجمع بعد فلا يصلح
+    # pool.checkedout() في تلك اللحظة
+    checked_out = [0]
+    lock = threading.Lock()
+
+    def report(change):
+        # SingletonThreadPool (SQLite في الذاكرة) ليس له حجم
+        if not isinstance(engine.pool, QueuePool):
+            return
+        with lock:
+            checked_out[0] += change
+            DB_POOL_CHECKED_OUT.set(checked_out[0])
+            DB_POOL_OVERFLOW.set(max(checked_out[0] - engine.pool.size(), 0))
+
+    @event.listens_for(engine, 'checkout')
+    def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+        report(1)
+
+    @event.listens_for(engine, 'checkin')
+    def _pool_checkin(dbapi_connection, connection_record):
+        report(-1)
+
+
+def metrics_payload():
+    """نص المقاييس بصيغة Prometheus ونوع المحتوى"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -145,11 +145,18 @@ class Category(db.Model):
     name_ar = db.Column(db.String(100), nullable=False)
     description_ar = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     products = db.relationship('Product', backref='category', lazy=True)
 
 class Product(db.Model):
+    # مفاتيح ترتيب قائمة المنتجات المقسمة إلى صفحات
+    __table_args__ = (
+        db.Index('ix_product_name_ar_id', 'name_ar', 'id'),
+        db.Index('ix_product_retail_price_id', 'retail_price', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name_ar = db.Column(db.String(200), nullable=False)
     description_ar = db.Column(db.Text)
@@ -161,8 +168,9 @@ class Product(db.Model):
     min_stock_threshold = db.Column(db.Float, nullable=False, default=10)
     unit_type = db.Column(db.String(50), nullable=False, default='كامل')  # 'كامل' or 'جزئي'
     unit_description = db.Column(db.String(100))  # وصف الوحدة مثل "صفحة" أو "فصل"
+    search_key = db.Column(db.Text)  # الاسم والوصف بعد توحيد الكتابة (انظر product_search)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     sale_items = db.relationship('SaleItem', backref='product', lazy=True)
@@ -202,7 +210,10 @@ class Customer(db.Model):
     phone = db.Column(db.String(20))
     address = db.Column(db.Text)
     notes = db.Column(db.Text)
+    balance = db.Column(db.Float, nullable=False, default=0, comment='الدين المستحق (يتم تحديثه مع كل بيع ودفعة)')
+    last_activity_at = db.Column(db.DateTime, nullable=True, comment='تاريخ آخر عملية')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     sales = db.relationship('Sale', backref='customer', lazy=True)
@@ -210,9 +221,7 @@ class Customer(db.Model):
     @property
     def total_debt(self):
         """إجمالي الدين المستحق على العميل"""
-        total_sales = sum(sale.total_amount for sale in self.sales if sale.payment_status != 'paid')
-        total_payments = sum(payment.amount for sale in self.sales for payment in sale.payments)
-        return max(0, total_sales - total_payments)
+        return max(0, self.balance or 0)
     
     @property
     def total_sales_amount(self):
@@ -226,13 +235,18 @@ class Sale(db.Model):
     discount_value = db.Column(db.Float, nullable=False, default=0, comment='قيمة الخصم')
     discount_amount = db.Column(db.Float, nullable=False, default=0, comment='مبلغ الخصم المحسوب')
     total_amount = db.Column(db.Float, nullable=False)
-    sale_date = db.Column(db.DateTime, default=datetime.utcnow)
+    sale_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=True)
     payment_status = db.Column(db.String(20), nullable=False, default='paid')  # 'paid', 'partial', 'unpaid'
     payment_type = db.Column(db.String(20), nullable=False, default='cash')  # 'cash', 'credit'
     notes = db.Column(db.Text)
     
+    __table_args__ = (
+        # ديون العميل: المبيعات غير المدفوعة لكل عميل
+        db.Index('ix_sale_customer_id_payment_status', 'customer_id', 'payment_status'),
+    )
+    
     # Relationships
     sale_items = db.relationship('SaleItem', backref='sale', lazy=True, cascade='all, delete-orphan')
     payments = db.relationship('Payment', backref='sale', lazy=True, cascade='all, delete-orphan')
@@ -257,21 +271,13 @@ class Sale(db.Model):
     @property
     def total_profit(self):
         """إجمالي ربح البيع"""
-        profit = 0
-        for item in self.sale_items:
-            if item.product:
-                # الربح = (سعر البيع - سعر الجملة) × الكمية
-                profit += (item.unit_price - item.product.wholesale_price) * item.quantity
-        return profit
+        # الربح = (سعر البيع - سعر الجملة وقت البيع) × الكمية
+        return sum(item.profit for item in self.sale_items)
     
     @property
     def cost_amount(self):
-        """إجمالي تكلفة البيع (بسعر الجملة)"""
-        cost = 0
-        for item in self.sale_items:
-            if item.product:
-                cost += item.product.wholesale_price * item.quantity
-        return cost
+        """إجمالي تكلفة البيع (بسعر الجملة وقت البيع)"""
+        return sum(item.cost_amount for item in self.sale_items)
     
     @property
     def discount_type_ar(self):
@@ -298,9 +304,9 @@ class Sale(db.Model):
 
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
-    payment_date = db.Column(db.DateTime, default=datetime.utcnow)
+    payment_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     payment_method = db.Column(db.String(50), nullable=False, default='نقدي')  # نقدي، تحويل، إلخ
     notes = db.Column(db.Text)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # من سجل الدفعة
@@ -311,15 +317,102 @@ class Payment(db.Model):
 class SaleItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sale_id = db.Column(db.Integer, db.ForeignKey('sale.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Float, nullable=False)
     unit_price = db.Column(db.Float, nullable=False)
+    unit_cost = db.Column(db.Float, nullable=True, comment='سعر الجملة وقت البيع')
     total_price = db.Column(db.Float, nullable=False)
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if self.quantity and self.unit_price:
             self.total_price = self.quantity * self.unit_price
+    
+    @property
+    def effective_unit_cost(self):
+        """سعر الجملة المسجل وقت البيع (أو سعر الجملة الحالي للأصناف القديمة)"""
+        if self.unit_cost is not None:
+            return self.unit_cost
+        return self.product.wholesale_price if self.product else None
+    
+    @property
+    def cost_amount(self):
+        unit_cost = self.effective_unit_cost
+        return unit_cost * self.quantity if unit_cost is not None else 0
+    
+    @property
+    def profit(self):
+        unit_cost = self.effective_unit_cost
+        return (self.unit_price - unit_cost) * self.quantity if unit_cost is not None else 0
+
+# ملخص المبيعات اليومي (يتم تحديثه مع كل بيع ودفعة ومرتجع)
+class DailySalesSummary(db.Model):
+    __tablename__ = 'daily_sales_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, comment='يوم العمل')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, comment='البائع')
+    sales_count = db.Column(db.Integer, nullable=False, default=0, comment='عدد المبيعات')
+    revenue = db.Column(db.Float, nullable=False, default=0, comment='إجمالي المبيعات بعد الخصم')
+    cost = db.Column(db.Float, nullable=False, default=0, comment='التكلفة بسعر الجملة')
+    profit = db.Column(db.Float, nullable=False, default=0, comment='الربح قبل الخصم')
+    credit_sales_count = db.Column(db.Integer, nullable=False, default=0, comment='عدد المبيعات الآجلة')
+    credit_amount = db.Column(db.Float, nullable=False, default=0, comment='إجمالي المبيعات الآجلة')
+    payments_amount = db.Column(db.Float, nullable=False, default=0, comment='الدفعات المحصلة')
+    returns_count = db.Column(db.Integer, nullable=False, default=0, comment='عدد المرتجعات المقبولة')
+    returns_amount = db.Column(db.Float, nullable=False, default=0, comment='قيمة المرتجعات المقبولة')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'user_id', name='uq_daily_sales_summary_day_user'),
+    )
+
+    # Relationships
+    user = db.relationship('User', backref='daily_summaries', lazy=True)
+
+# نتائج الطلبات المنفذة حسب مفتاح التكرار (Idempotency-Key أو local_id)
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    scope = db.Column(db.String(30), nullable=False, comment='sale / sync_sale')
+    key = db.Column(db.String(100), nullable=False, comment='المفتاح المرسل من العميل')
+    response = db.Column(db.Text, nullable=False, comment='الرد المحفوظ (JSON)')
+    status_code = db.Column(db.Integer, nullable=False, default=200)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'scope', 'key', name='uq_idempotency_key_user_scope_key'),
+    )
+
+# سجلات الحذف للمزامنة التزايدية (يتم إنشاؤها تلقائياً عند حذف منتج أو فئة أو عميل)
+class SyncTombstone(db.Model):
+    __tablename__ = 'sync_tombstone'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(30), nullable=False, comment='product / category / customer')
+    entity_id = db.Column(db.Integer, nullable=False, comment='معرف الصف المحذوف')
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_sync_tombstone_entity_deleted_at', 'entity', 'deleted_at'),
+    )
+
+# المهام الطويلة التي تعمل في الخلفية (استيراد، تصدير...) وحالة تقدمها
+class Job(db.Model):
+    __tablename__ = 'job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False, comment='نوع المهمة')
+    status = db.Column(db.String(20), nullable=False, default='queued', comment='queued / running / done / failed')
+    progress = db.Column(db.Float, nullable=False, default=0, comment='نسبة الإنجاز من 0 إلى 100')
+    message = db.Column(db.String(300), comment='آخر رسالة حالة أو سبب الفشل')
+    result = db.Column(db.Text, comment='نتيجة المهمة (JSON)')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
 
 # نموذج جديد للمصاريف
 class Expense(db.Model):
@@ -327,7 +420,7 @@ class Expense(db.Model):
     description = db.Column(db.String(200), nullable=False, comment='وصف المصروف')
     amount = db.Column(db.Float, nullable=False, comment='المبلغ')
     expense_type = db.Column(db.String(50), nullable=False, comment='نوع المصروف')  # 'salary', 'rent', 'utilities', 'other'
-    expense_date = db.Column(db.DateTime, default=datetime.utcnow, comment='تاريخ المصروف')
+    expense_date = db.Column(db.DateTime, default=datetime.utcnow, index=True, comment='تاريخ المصروف')
     category = db.Column(db.String(100), comment='فئة المصروف')
     notes = db.Column(db.Text, comment='ملاحظات')
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, comment='المستخدم الذي سجل المصروف')
@@ -0,0 +1,213 @@
+"""
+Excel product import
+
+The workbook is parsed with openpyxl's ``read_only`` mode, which streams rows
+instead of loading the whole sheet. Categories and existing products are
+looked up in name -> id maps loaded once, and the rows are written in chunks
+with one bulk INSERT and one bulk UPDATE per chunk, each chunk in its own
+transaction. ``import_products`` is meant to run as a background job (see
+``jobs``).
+"""
+
+import logging
+import os
+from datetime import datetime
+
+from openpyxl import load_workbook
+from sqlalchemy import insert, update
+
+from delta_sync import touch_categories
+from models import db, Product, Category
+from product_search import product_search_key
+
+
+IMPORT_CHUNK_SIZE = 1000
+
+REQUIRED_COLUMNS = ['اسم المنتج', 'الفئة', 'سعر الجملة', 'سعر البيع', 'الكمية']
+
+logger = logging.getLogger(__name__)
+
+
+class ImportFileError(ValueError):
+    """ملف لا يمكن استيراده (لا يمكن قراءته أو تنقصه أعمدة)"""
+
+
+def _open_sheet(path):
+    try:
+        workbook = load_workbook(path, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f'خطأ في قراءة ملف Excel: {str(e)}')
+    return workbook, workbook.active
+
+
+def _read_headers(sheet):
+    first_row = next(sheet.iter_rows(max_row=1, values_only=True), ())
+    return [str(value).strip() if value else '' for value in first_row]
+
+
+def check_import_file(path):
+    """التحقق السريع من الملف قبل بدء الاستيراد (يقرأ صف العناوين فقط)"""
+    workbook, sheet = _open_sheet(path)
+    try:
+        headers = _read_headers(sheet)
+    finally:
+        workbook.close()
+
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in headers]
+    if missing_columns:
+        raise ImportFileError(f'أعمدة مفقودة: {", ".join(missing_columns)}')
+
+
+def _parse_row(row, row_num, column_index, categories):
+    """تحويل صف إلى قيم المنتج. ترجع (الاسم، القيم) أو ترفع ValueError برسالة الخطأ"""
+    def get_cell_value(column_name, default=''):
+        if column_name in column_index and column_index[column_name] < len(row):
+            value = row[column_index[column_name]]
+            if value is None:
+                return default
+            value_str = str(value).strip()
+            return value_str if value_str.lower() not in ['none', 'nan', ''] else default
+        return default
+
+    product_name = get_cell_value('اسم المنتج')
+    category_name = get_cell_value('الفئة')
+
+    if not product_name:
+        raise ValueError(f'الصف {row_num}: اسم المنتج فارغ أو غير صحيح')
+
+    try:
+        wholesale_price = float(get_cell_value('سعر الجملة', '0'))
+        retail_price = float(get_cell_value('سعر البيع', '0'))
+        stock_quantity = float(get_cell_value('الكمية', '0'))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'الصف {row_num}: خطأ في تحويل الأرقام - {str(e)}')
+
+    if wholesale_price <= 0 or retail_price <= 0:
+        raise ValueError(f'الصف {row_num}: أسعار غير صحيحة')
+
+    if retail_price <= wholesale_price:
+        raise ValueError(f'الصف {row_num}: سعر البيع يجب أن يكون أكبر من سعر الجملة')
+
+    category_id = categories.get(category_name)
+    if category_id is None:
+        raise ValueError(f'الصف {row_num}: الفئة "{category_name}" غير موجودة')
+
+    try:
+        min_stock = float(get_cell_value('الحد الأدنى للمخزون', '10'))
+    except (ValueError, TypeError):
+        min_stock = 10
+
+    unit_type = get_cell_value('نوع الوحدة', 'كامل')
+    if unit_type not in ['كامل', 'جزئي']:
+        unit_type = 'كامل'
+
+    description = get_cell_value('وصف المنتج')
+    return product_name, dict(
+        description_ar=description,
+        search_key=product_search_key(product_name, description),
+        category_id=category_id,
+        wholesale_price=wholesale_price,
+        retail_price=retail_price,
+        price=retail_price,
+        stock_quantity=stock_quantity,
+        min_stock_threshold=min_stock,
+        unit_type=unit_type,
+        unit_description=get_cell_value('وصف الوحدة')
+    )
+
+
+def _import_rows(sheet, update_existing, progress):
+    headers = _read_headers(sheet)
+    column_index = {header: i for i, header in enumerate(headers) if header}
+    total_rows = (sheet.max_row or 1) - 1  # من أبعاد الورقة المحفوظة في الملف
+
+    categories = dict(db.session.query(Category.name_ar, Category.id))
+    # عند تكرار الاسم يُعتمد أقدم منتج
+    products = {name: product_id for name, product_id in
+                db.session.query(Product.name_ar, Product.id).order_by(Product.id.desc())}
+
+    added_count = updated_count = skipped_count = 0
+    errors = []
+    new_rows = {}      # الاسم -> قيم منتج جديد في الدفعة الحالية
+    updated_rows = {}  # معرف المنتج -> قيم التحديث في الدفعة الحالية
+
+    def write_chunk(processed):
+        if new_rows:
+            inserted = db.session.execute(
+                insert(Product).returning(Product.id, Product.name_ar),
+                [dict(name_ar=name, **values) for name, values in new_rows.items()]
+            )
+            products.update({name: product_id for product_id, name in inserted})
+        if updated_rows:
+            db.session.execute(update(Product), list(updated_rows.values()))
+        # الإدراج والتحديث المجمع لا يمر بأحداث الكائنات، وقد يغير عدد منتجات الفئات
+        touch_categories(db.session.connection(), [values['category_id'] for values in
+                                                   list(new_rows.values()) + list(updated_rows.values())])
+        db.session.commit()
+        new_rows.clear()
+        updated_rows.clear()
+        if total_rows > 0:
+            progress(processed * 100.0 / total_rows, f'تمت معالجة {processed} من {total_rows} صف')
+        else:
+            # بعض البرامج لا تحفظ أبعاد الورقة فلا يُعرف عدد الصفوف مسبقاً
+            progress(0, f'تمت معالجة {processed} صف')
+
+    processed = 0
+    for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), 2):
+        if processed and processed % IMPORT_CHUNK_SIZE == 0:
+            write_chunk(processed)
+        processed += 1
+
+        # تجاهل الصفوف الفارغة
+        if all(v is None or str(v).strip() == '' for v in row):
+            continue
+
+        try:
+            product_name, values = _parse_row(row, row_num, column_index, categories)
+        except ValueError as e:
+            errors.append(str(e))
+            skipped_count += 1
+            continue
+
+        if product_name in new_rows or product_name in products:
+            if not update_existing:
+                skipped_count += 1
+            elif product_name in new_rows:
+                new_rows[product_name].update(values)
+                updated_count += 1
+            else:
+                product_id = products[product_name]
+                updated_rows[product_id] = dict(id=product_id, updated_at=datetime.utcnow(), **values)
+                updated_count += 1
+        else:
+            new_rows[product_name] = values
+            added_count += 1
+
+    write_chunk(processed)
+
+    logger.info(f"Import summary: added={added_count}, updated={updated_count}, skipped={skipped_count}, errors={len(errors)}")
+    return {
+        'success': True,
+        'message': 'تم استيراد المنتجات بنجاح',
+        'added_count': added_count,
+        'updated_count': updated_count,
+        'skipped_count': skipped_count,
+        'errors': errors[:10],  # أول 10 أخطاء فقط
+        'total_rows_processed': added_count + updated_count + skipped_count
+    }
+
+
+def import_products(progress, path, update_existing=False):
+    """استيراد المنتجات من ملف Excel (يُحذف الملف بعد الانتهاء)
+
+    progress(نسبة، رسالة) تُستدعى بعد حفظ كل دفعة. ترجع ملخص الاستيراد بنفس
+    شكل رد الاستيراد السابق.
+    """
+    try:
+        workbook, sheet = _open_sheet(path)
+        try:
+            return _import_rows(sheet, update_existing, progress)
+        finally:
+            workbook.close()
+    finally:
+        os.remove(path)
@@ -0,0 +1,180 @@
+"""
+Product search
+
+Every product stores ``search_key``: its name and description with Arabic
+spelling variants folded together (hamza forms of alef, alef maqsura, taa
+marbuta, tashkeel and tatweel removed, Arabic-Indic digits) and each word
+that starts with the definite article also indexed without it. Queries are
+normalised the same way, so "اسلامية" finds "الإسلاميّة".
+
+The key is indexed according to the database:
+
+* SQLite: an external-content FTS5 table ``product_fts`` kept in sync by
+  triggers, queried with prefix terms and ranked by bm25 (over at most
+  ``SEARCH_RANK_CANDIDATES`` matches, so one-letter queries stay fast).
+* PostgreSQL: a ``pg_trgm`` GIN index on ``search_key``, queried with
+  substring matches and ranked by ``word_similarity``.
+
+Other databases fall back to LIKE on ``search_key``.
+"""
+
+import re
+
+from sqlalchemy import event, false, and_, select, text, update, table, column, func
+
+from models import db, Product
+
+
+SEARCH_BATCH_SIZE = 1000
+
+# عدد المطابقات التي تُرتب بـ bm25 في SQLite؛ ترتيب كل المطابقات لبحث عام جداً
+# (حرف أو حرفين) يكلف عشرات الملي ثانية على 100 ألف منتج
+SEARCH_RANK_CANDIDATES = 1000
+
+_TASHKEEL = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_NON_WORD = re.compile(r'[^\w]+')
+_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+})
+
+# "الكتاب" تُفهرس أيضاً "كتاب" حتى يجدها البحث من بداية الكلمة
+_ARTICLES = ('وال', 'بال', 'كال', 'فال', 'ال', 'لل')
+
+_fts = table('product_fts', column('rowid'), column('rank'), column('product_fts'))
+
+
+def normalize_arabic(value):
+    """توحيد كتابة النص للبحث. ترجع قائمة الكلمات بعد التوحيد"""
+    if not value:
+        return []
+    value = _TASHKEEL.sub('', str(value)).translate(_LETTERS).lower()
+    return [word for word in _NON_WORD.sub(' ', value).replace('_', ' ').split() if word]
+
+
+def product_search_key(name, description=None):
+    """مفتاح البحث المخزن للمنتج من اسمه ووصفه"""
+    words = []
+    for word in normalize_arabic(name) + normalize_arabic(description):
+        words.append(word)
+        for article in _ARTICLES:
+            if word.startswith(article) and len(word) - len(article) >= 2:
+                words.append(word[len(article):])
+                break
+    return ' '.join(words)
+
+
+@event.listens_for(Product, 'before_insert')
+@event.listens_for(Product, 'before_update')
+def _set_search_key(mapper, connection, target):
+    target.search_key = product_search_key(target.name_ar, target.description_ar)
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def product_search_filter(query, id_column=Product.id):
+    """شرط يطابق المنتجات التي تحتوي كل كلمات البحث
+
+    id_column عمود معرف المنتج المراد تصفيته (مثلاً SaleItem.product_id).
+    """
+    words = normalize_arabic(query)
+    if not words:
+        return false()
+
+    if _dialect() == 'sqlite':
+        matches = select(_fts.c.rowid).where(_fts.c.product_fts.op('MATCH')(_match_expression(words)))
+        return id_column.in_(matches)
+
+    matches = select(Product.id).where(and_(*[Product.search_key.contains(word, autoescape=True) for word in words]))
+    return id_column.in_(matches)
+
+
+def _match_expression(words):
+    # كل كلمة كبادئة بين علامتي تنصيص، والكلمات مجتمعة (AND)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_products(query, limit=10):
+    """المنتجات المطابقة للبحث مرتبة حسب قرب المطابقة"""
+    words = normalize_arabic(query)
+    if not words:
+        return []
+
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        candidates = select(_fts.c.rowid, _fts.c.rank).where(
+            _fts.c.product_fts.op('MATCH')(_match_expression(words))
+        ).limit(SEARCH_RANK_CANDIDATES).subquery()
+        return Product.query.join(candidates, candidates.c.rowid == Product.id).order_by(
+            candidates.c.rank, Product.name_ar
+        ).limit(limit).all()
+
+    results = Product.query.filter(product_search_filter(query))
+    if dialect == 'postgresql':
+        results = results.order_by(func.word_similarity(' '.join(words), Product.search_key).desc(), Product.name_ar)
+    else:
+        results = results.order_by(Product.name_ar)
+    return results.limit(limit).all()
+
+
+_SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+    "search_key, content='product', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts(rowid, search_key) VALUES (new.id, new.search_key); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, search_key) VALUES ('delete', old.id, old.search_key); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF search_key ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, search_key) VALUES ('delete', old.id, old.search_key); "
+    "INSERT INTO product_fts(rowid, search_key) VALUES (new.id, new.search_key); END",
+    "INSERT INTO product_fts(product_fts) VALUES ('rebuild')",
+]
+
+_POSTGRESQL_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_product_search_key_trgm ON product USING gin (search_key gin_trgm_ops)",
+]
+
+
+def create_search_index(connection):
+    """إنشاء فهرس البحث حسب نوع قاعدة البيانات (آمن عند تكراره)"""
+    statements = {'sqlite': _SQLITE_INDEX, 'postgresql': _POSTGRESQL_INDEX}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Product.__table__, 'after_create')
+def _create_search_index_with_table(target, connection, **kw):
+    create_search_index(connection)
+
+
+@event.listens_for(Product.__table__, 'after_drop')
+def _drop_search_index_with_table(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DROP TABLE IF EXISTS product_fts"))
+
+
+def rebuild_search_keys():
+    """إعادة حساب مفتاح البحث لكل المنتجات على دفعات. ترجع عدد المنتجات"""
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Product.id, Product.name_ar, Product.description_ar, Product.updated_at).filter(
+            Product.id > last_id
+        ).order_by(Product.id).limit(SEARCH_BATCH_SIZE).all()
+        if not rows:
+            break
+        db.session.execute(update(Product), [
+            # الإبقاء على تاريخ التعديل حتى لا تُعاد مزامنة كل المنتجات للأجهزة
+            {'id': row.id, 'search_key': product_search_key(row.name_ar, row.description_ar),
+             'updated_at': row.updated_at}
+            for row in rows
+        ])
+        db.session.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+    return total
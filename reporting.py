@@ -0,0 +1,345 @@
+"""
+Reporting helpers shared by the dashboard, reports and list pages
+
+Date filters are expressed as half-open ranges ``[start, end)`` on the raw
+datetime column instead of ``func.date(column)``, so the database can use
+the indexes on ``sale.sale_date``, ``payment.payment_date`` and
+``expense.expense_date``.
+
+Revenue, cost and profit figures are read from the pre-aggregated
+``daily_sales_summary`` table maintained by ``ledger``.
+
+List data handed to templates from cached snapshots is returned as plain
+result rows, never ORM instances, so it stays valid after the session that
+loaded it is gone.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, date, time, timedelta
+
+from sqlalchemy import and_, true, func, case, desc, tuple_
+
+from models import db, DailySalesSummary, Product, Category, Customer, Expense, Payment, Sale, SaleItem, User
+
+
+# حدود توزيع الديون في تقرير الديون
+LARGE_DEBT = 1000
+MEDIUM_DEBT = 500
+
+
+def parse_day(value):
+    """تحويل قيمة (نص YYYY-MM-DD أو date أو datetime) إلى date، أو None إذا كانت غير صالحة"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def day_start(day):
+    """بداية اليوم (00:00) كـ datetime"""
+    return datetime.combine(day, time.min)
+
+
+def day_bounds(day):
+    """حدود اليوم الواحد [بداية اليوم، بداية اليوم التالي)"""
+    start = day_start(day)
+    return start, start + timedelta(days=1)
+
+
+def within_days(column, start_day=None, end_day=None):
+    """شرط SQL لفترة أيام كاملة: من بداية start_day حتى نهاية end_day (شاملة)
+
+    يعادل ``func.date(column) BETWEEN start_day AND end_day`` لكنه يسمح
+    باستخدام الفهرس على العمود. أي طرف يساوي None يتم تجاهله.
+    """
+    conditions = []
+    if start_day is not None:
+        conditions.append(column >= day_start(start_day))
+    if end_day is not None:
+        conditions.append(column < day_start(end_day) + timedelta(days=1))
+    return and_(true(), *conditions)
+
+
+def on_day(column, day):
+    """شرط SQL ليوم واحد بنطاق نصف مفتوح"""
+    return within_days(column, day, day)
+
+
+def _summary_range(query, start_day=None, end_day=None):
+    if start_day is not None:
+        query = query.filter(DailySalesSummary.day >= start_day)
+    if end_day is not None:
+        query = query.filter(DailySalesSummary.day <= end_day)
+    return query
+
+
+def sales_summary(start_day=None, end_day=None):
+    """إجماليات المبيعات لفترة من جدول الملخص اليومي (استعلام واحد)"""
+    fields = ('sales_count', 'revenue', 'cost', 'profit', 'credit_sales_count',
+              'credit_amount', 'payments_amount', 'returns_count', 'returns_amount')
+    query = db.session.query(*[
+        func.coalesce(func.sum(getattr(DailySalesSummary, name)), 0) for name in fields
+    ])
+    row = _summary_range(query, start_day, end_day).one()
+    return dict(zip(fields, row))
+
+
+def daily_revenue(start_day=None, end_day=None):
+    """إجمالي المبيعات لكل يوم في الفترة (لرسم المبيعات اليومية)"""
+    query = db.session.query(
+        DailySalesSummary.day,
+        func.sum(DailySalesSummary.revenue)
+    ).filter(DailySalesSummary.sales_count > 0)
+    query = _summary_range(query, start_day, end_day)
+    return [
+        {'date': parse_day(day).strftime('%Y-%m-%d'), 'total': float(total or 0)}
+        for day, total in query.group_by(DailySalesSummary.day).order_by(DailySalesSummary.day)
+    ]
+
+
+def _sum_if(condition, value=1):
+    """SUM(CASE WHEN condition THEN value ELSE 0 END) مع تحويل NULL إلى 0"""
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+
+def dashboard_figures(today=None):
+    """جميع أرقام لوحة التحكم في استعلام واحد
+
+    كل جدول يتم تجميعه في جدول مشتق من صف واحد، ثم تُدمج الصفوف في
+    SELECT واحد.
+    """
+    today = today or datetime.now().date()
+    month_start = today.replace(day=1)
+    today_start, tomorrow_start = day_bounds(today)
+
+    products = db.session.query(
+        func.count(Product.id).label('total_products'),
+        _sum_if(Product.stock_quantity <= Product.min_stock_threshold).label('low_stock_products'),
+        _sum_if(Product.stock_quantity <= 0).label('out_of_stock_products')
+    ).subquery()
+
+    categories = db.session.query(
+        func.count(Category.id).label('total_categories')
+    ).subquery()
+
+    is_today = DailySalesSummary.day == today
+    sales = db.session.query(
+        func.coalesce(func.sum(DailySalesSummary.revenue), 0).label('month_revenue'),
+        func.coalesce(func.sum(DailySalesSummary.profit), 0).label('month_profit'),
+        func.coalesce(func.sum(DailySalesSummary.cost), 0).label('month_cost'),
+        _sum_if(is_today, DailySalesSummary.revenue).label('today_revenue'),
+        _sum_if(is_today, DailySalesSummary.profit).label('today_profit')
+    ).filter(DailySalesSummary.day >= month_start).subquery()
+
+    expenses = db.session.query(
+        func.coalesce(func.sum(Expense.amount), 0).label('month_total_expenses'),
+        _sum_if(and_(Expense.expense_date >= today_start, Expense.expense_date < tomorrow_start),
+                Expense.amount).label('today_total_expenses')
+    ).filter(Expense.expense_date >= day_start(month_start)).subquery()
+
+    debts = db.session.query(
+        _sum_if(Customer.balance > 0, Customer.balance).label('total_debt'),
+        _sum_if(Customer.balance > 0).label('customers_with_debt')
+    ).subquery()
+
+    parts = (products, categories, sales, expenses, debts)
+    joined = products
+    for part in parts[1:]:
+        joined = joined.join(part, true())
+
+    row = db.session.query(*[column for part in parts for column in part.c]).select_from(joined).one()
+    return dict(row._mapping)
+
+
+def dashboard_snapshot(today=None):
+    """بيانات لوحة التحكم كاملة: الأرقام وقوائم آخر المبيعات والتنبيهات والأكثر مبيعاً"""
+    today = today or datetime.now().date()
+    month_start = today.replace(day=1)
+
+    snapshot = dashboard_figures(today)
+    snapshot['month_net_profit'] = snapshot['month_profit'] - snapshot['month_total_expenses']
+    snapshot['today_net_profit'] = snapshot['today_profit'] - snapshot['today_total_expenses']
+
+    snapshot['recent_sales'] = db.session.query(
+        Sale.id, Sale.sale_date, Sale.total_amount, User.username
+    ).outerjoin(User, User.id == Sale.user_id).order_by(desc(Sale.sale_date)).limit(5).all()
+
+    snapshot['low_stock_alerts'] = db.session.query(
+        Product.id, Product.name_ar, Product.stock_quantity, Product.min_stock_threshold,
+        (Product.stock_quantity <= 0).label('is_out_of_stock')
+    ).filter(Product.stock_quantity <= Product.min_stock_threshold).all()
+
+    snapshot['top_products'] = db.session.query(
+        Product.name_ar,
+        func.sum(SaleItem.quantity).label('total_sold')
+    ).join(SaleItem).join(Sale).filter(
+        within_days(Sale.sale_date, month_start)
+    ).group_by(Product.id).order_by(desc('total_sold')).limit(5).all()
+
+    return snapshot
+
+
+def unpaid_sales_query():
+    """المبيعات الآجلة التي لم تُدفع بالكامل مع المتبقي منها (remaining_amount)
+
+    نفس حساب Sale.remaining_amount لكن بمجموع الدفعات في استعلام مجمع
+    بدلاً من تحميل دفعات كل بيع.
+    """
+    paid = db.session.query(
+        Payment.sale_id.label('sale_id'),
+        func.sum(Payment.amount).label('paid')
+    ).group_by(Payment.sale_id).subquery()
+
+    remaining = Sale.total_amount - func.coalesce(paid.c.paid, 0)
+    return db.session.query(
+        Sale.id, Sale.customer_id, Sale.sale_date, Sale.total_amount,
+        remaining.label('remaining_amount')
+    ).outerjoin(paid, paid.c.sale_id == Sale.id).filter(
+        Sale.customer_id.isnot(None),
+        Sale.payment_type != 'cash',
+        Sale.payment_status != 'paid',
+        remaining > 0
+    )
+
+
+def debts_overview():
+    """أرقام تقرير الديون لكل العملاء المدينين في استعلام واحد"""
+    debtors = Customer.balance > 0
+    unpaid_sales = unpaid_sales_query().join(Customer, Customer.id == Sale.customer_id).filter(debtors).subquery()
+
+    row = db.session.query(
+        _sum_if(debtors, Customer.balance).label('total_debts'),
+        _sum_if(debtors).label('customers_count'),
+        _sum_if(Customer.balance > LARGE_DEBT).label('large_debts'),
+        _sum_if(and_(Customer.balance > MEDIUM_DEBT, Customer.balance <= LARGE_DEBT)).label('medium_debts'),
+        _sum_if(and_(debtors, Customer.balance <= MEDIUM_DEBT)).label('small_debts'),
+        db.session.query(func.count()).select_from(unpaid_sales).scalar_subquery().label('unpaid_sales_count')
+    ).one()
+    return dict(row._mapping)
+
+
+def debt_summary(limit=10):
+    """إجمالي الديون وعدد المدينين وأكبر limit مدينين في استعلام واحد
+
+    أكبر المدينين يُختارون بالرصيد المخزن (ORDER BY ... LIMIT في قاعدة
+    البيانات)، ثم يُجمع عدد مبيعاتهم غير المسددة وتاريخ آخر بيع لهم فقط.
+    ترجع (إجمالي الديون، عدد المدينين، قائمة صفوف: id, name, balance,
+    unpaid_sales_count, last_sale_date).
+    """
+    debtors = Customer.balance > 0
+    totals = db.session.query(
+        _sum_if(debtors, Customer.balance).label('total_debts'),
+        _sum_if(debtors).label('customers_with_debts')
+    ).subquery()
+
+    top = db.session.query(Customer.id, Customer.name, Customer.balance).filter(debtors).order_by(
+        desc(Customer.balance), Customer.id
+    ).limit(limit).subquery()
+
+    sales = db.session.query(
+        Sale.customer_id.label('customer_id'),
+        _sum_if(Sale.payment_status.in_(['unpaid', 'partial'])).label('unpaid_sales_count'),
+        func.max(Sale.sale_date).label('last_sale_date')
+    ).filter(Sale.customer_id.in_(db.session.query(top.c.id))).group_by(Sale.customer_id).subquery()
+
+    # صف الإجماليات موجود دائماً حتى لو لم يكن هناك مدينون
+    rows = db.session.query(
+        totals.c.total_debts, totals.c.customers_with_debts,
+        top.c.id, top.c.name, top.c.balance,
+        func.coalesce(sales.c.unpaid_sales_count, 0).label('unpaid_sales_count'),
+        sales.c.last_sale_date
+    ).select_from(totals).outerjoin(top, true()).outerjoin(
+        sales, sales.c.customer_id == top.c.id
+    ).order_by(desc(top.c.balance), top.c.id).all()
+
+    top_debtors = [row for row in rows if row.id is not None]
+    return float(rows[0].total_debts), rows[0].customers_with_debts, top_debtors
+
+
+def unpaid_sales_by_customer(customer_ids):
+    """المبيعات غير المسددة لعملاء محددين (الأقدم أولاً). ترجع dict: customer_id -> قائمة"""
+    result = {}
+    if not customer_ids:
+        return result
+    rows = unpaid_sales_query().filter(Sale.customer_id.in_(customer_ids)).order_by(Sale.sale_date, Sale.id)
+    for row in rows:
+        result.setdefault(row.customer_id, []).append(row)
+    return result
+
+
+def last_sale_dates(customer_ids):
+    """تاريخ آخر بيع لعملاء محددين. ترجع dict: customer_id -> datetime"""
+    if not customer_ids:
+        return {}
+    return dict(db.session.query(Sale.customer_id, func.max(Sale.sale_date)).filter(
+        Sale.customer_id.in_(customer_ids)
+    ).group_by(Sale.customer_id))
+
+
+def encode_cursor(values):
+    """ترميز قيم مفتاح الترتيب كنص آمن للاستخدام في الرابط"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """فك ترميز cursor، أو None إذا كان فارغاً أو غير صالح"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    return values if isinstance(values, list) and len(values) == 2 else None
+
+
+class KeysetPage:
+    """صفحة نتائج مقسمة بالمفتاح (keyset) بدلاً من OFFSET"""
+
+    def __init__(self, items, has_prev, has_next, key):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = encode_cursor(key(items[0])) if items and has_prev else None
+        self.next_cursor = encode_cursor(key(items[-1])) if items and has_next else None
+
+
+def keyset_page(query, column, id_column, descending=False, after=None, before=None, per_page=50):
+    """صفحة من query مرتبة بـ (column, id_column) تبدأ بعد cursor أو تنتهي قبله
+
+    تكلفة كل صفحة ثابتة مهما كان رقمها لأن قاعدة البيانات تبدأ مباشرة من
+    المفتاح بدلاً من تخطي OFFSET صف. id_column يضمن ترتيباً فريداً عند
+    تساوي قيم column.
+    """
+    key_columns = tuple_(column, id_column)
+    after, before = decode_cursor(after), decode_cursor(before)
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+
+    # الرجوع للخلف = نفس الاستعلام بترتيب معكوس ثم عكس النتيجة
+    walk_desc = descending != backwards
+    if cursor is not None:
+        query = query.filter(key_columns < tuple_(*cursor) if walk_desc else key_columns > tuple_(*cursor))
+    order = (desc(column), desc(id_column)) if walk_desc else (column, id_column)
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+
+    def key(item):
+        return [getattr(item, column.key), getattr(item, id_column.key)]
+
+    return KeysetPage(rows, has_prev, has_next, key)
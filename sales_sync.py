@@ -0,0 +1,243 @@
+"""
+Batched upload of sales recorded by offline tills (``/api/sync`` type ``sales``)
+
+All products referenced by the batch are loaded with one IN query and stock
+is checked for the whole batch in memory, in upload order. Accepted sales are
+then written in chunks: one transaction per chunk, with one batched INSERT
+for the sales, one executemany INSERT for all their items and one
+conditional stock UPDATE per product. If a chunk fails (including when a
+concurrent checkout took the stock first) it is retried sale by sale, so
+every ``local_id`` still gets its own result.
+
+The ``local_id`` is also the idempotency key of the sale: the result of each
+written sale is stored with it, and a sale whose ``local_id`` was already
+written (a retried upload) gets the stored result back with
+``duplicate: true`` instead of being written again.
+"""
+
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from catalogue import products_by_id
+from idempotency import normalize_key, stored_responses, stored_response, remember_responses, SCOPE_SYNC_SALE
+from ledger import record_sales, adjust_customer_balance, sale_opening_balance, decrement_stock
+from models import db, Sale, SaleItem
+
+
+SYNC_CHUNK_SIZE = 100
+
+ITEM_COLUMNS = ('sale_id', 'product_id', 'quantity', 'unit_price', 'unit_cost', 'total_price')
+
+# حقول البيع الرقمية؛ الفارغ منها يُعتبر صفراً
+SALE_AMOUNT_FIELDS = ('subtotal', 'total_amount', 'discount_value', 'discount_amount')
+
+
+class SaleRejected(ValueError):
+    """بيع مرفوض قبل الكتابة (بيانات ناقصة أو مخزون غير كافٍ)"""
+
+
+def item_product_id(item_data):
+    try:
+        return int(item_data.get('product_id'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _number(value, field):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise SaleRejected(f'قيمة غير صالحة في الحقل {field}')
+    if not math.isfinite(number):
+        raise SaleRejected(f'قيمة غير صالحة في الحقل {field}')
+    return number
+
+
+def _validate_sale(sale_data, products, available):
+    """التحقق من بيع واحد وحجز كمياته من المخزون المتاح في الذاكرة
+
+    ترجع (amounts, lines): قيم حقول البيع الرقمية بعد تحويلها، وقائمة
+    (product_id, quantity, unit_price, total_price, unit_cost).
+    """
+    items = sale_data.get('items') or []
+    if not items:
+        raise SaleRejected('لا توجد عناصر في البيع')
+
+    # أجهزة قديمة ترسل المبالغ كنصوص؛ القيمة غير الصالحة ترفض هذا البيع وحده
+    amounts = {field: _number(sale_data.get(field) or 0, field) for field in SALE_AMOUNT_FIELDS}
+
+    lines = []
+    requested = defaultdict(float)
+    for item_data in items:
+        product = products.get(item_product_id(item_data))
+        if not product:
+            raise SaleRejected(f"المنتج رقم {item_data.get('product_id')} غير موجود")
+
+        quantity = _number(item_data.get('quantity'), 'quantity')
+        requested[product.id] += quantity
+        if available[product.id] < requested[product.id]:
+            raise SaleRejected(f'الكمية المطلوبة من {product.name_ar} غير متوفرة')
+
+        lines.append((product.id, quantity, _number(item_data.get('unit_price'), 'unit_price'),
+                      _number(item_data.get('total_price'), 'total_price'), product.wholesale_price))
+
+    for product_id, quantity in requested.items():
+        available[product_id] -= quantity
+    return amounts, lines
+
+
+def _build_sale(sale_data, amounts, user_id, sale_date):
+    return Sale(
+        **amounts,
+        discount_type=sale_data.get('discount_type', 'none'),
+        user_id=user_id,
+        customer_id=sale_data.get('customer_id'),
+        payment_status=sale_data.get('payment_status', 'paid'),
+        payment_type=sale_data.get('payment_type', 'cash'),
+        notes=sale_data.get('notes', ''),
+        sale_date=sale_date
+    )
+
+
+def _build_items(sale_id, lines):
+    """عناصر البيع ككائنات غير مضافة للجلسة (تُكتب بـ INSERT مجمّع)"""
+    return [
+        SaleItem(
+            sale_id=sale_id,
+            product_id=product_id,
+            quantity=quantity,
+            unit_price=unit_price,
+            unit_cost=unit_cost,
+            total_price=total_price
+        )
+        for product_id, quantity, unit_price, total_price, unit_cost in lines
+    ]
+
+
+def insert_sale_items(sale_items):
+    """كتابة أصناف البيع بـ INSERT مجمّع واحد (executemany) بدلاً من INSERT لكل صنف"""
+    rows = [{column: getattr(item, column) for column in ITEM_COLUMNS} for item in sale_items]
+    if rows:
+        db.session.execute(insert(SaleItem), rows)
+
+
+def _write_chunk(entries, user_id):
+    """كتابة مجموعة مبيعات مقبولة [(sale_data, (amounts, lines)), ...] في معاملة واحدة.
+    ترجع نتيجة كل بيع"""
+    now = datetime.utcnow()
+    sales = [_build_sale(sale_data, amounts, user_id, now) for sale_data, (amounts, _) in entries]
+    db.session.add_all(sales)
+    db.session.flush()  # للحصول على معرفات المبيعات
+
+    sale_items = [_build_items(sale.id, lines) for sale, (_, (_, lines)) in zip(sales, entries)]
+    insert_sale_items(item for items in sale_items for item in items)
+
+    sold = defaultdict(float)
+    for _, (_, lines) in entries:
+        for product_id, quantity, _, _, _ in lines:
+            sold[product_id] += quantity
+
+    record_sales(zip(sales, sale_items))
+
+    balances = defaultdict(float)
+    for sale in sales:
+        if sale.customer_id:
+            balances[sale.customer_id] += sale_opening_balance(sale)
+    for customer_id, delta in balances.items():
+        adjust_customer_balance(customer_id, delta, now)
+
+    # آخر خطوة قبل commit: بيع متزامن من جهاز آخر قد يكون سبقنا إلى المخزون
+    decrement_stock(sold, now)
+
+    saved = [
+        {'local_id': sale_data.get('local_id'), 'server_id': sale.id, 'sale_date': sale.sale_date.isoformat()}
+        for sale, (sale_data, _) in zip(sales, entries)
+    ]
+    remember_responses(SCOPE_SYNC_SALE, user_id, {
+        normalize_key(result['local_id']): result
+        for result in saved if normalize_key(result['local_id'])
+    })
+
+    db.session.commit()
+    return saved
+
+
+def sync_sales(sales_data, user_id, chunk_size=SYNC_CHUNK_SIZE):
+    """رفع مبيعات محفوظة محلياً دفعة واحدة
+
+    ترجع dict فيه success (local_id, server_id, sale_date) و errors
+    (local_id, data, error) و total.
+    """
+    results = {'success': [], 'errors': [], 'total': len(sales_data)}
+    outcomes = {}  # local_id -> نتيجة أول ظهور له في هذه الدفعة
+
+    def succeed(key, result, duplicate=False):
+        results['success'].append(dict(result, duplicate=True) if duplicate else result)
+        if key:
+            outcomes[key] = (True, result)
+
+    def reject(key, sale_data, error):
+        results['errors'].append({'local_id': sale_data.get('local_id'), 'data': sale_data, 'error': error})
+        if key:
+            outcomes[key] = (False, error)
+
+    keys = [normalize_key(sale_data.get('local_id')) for sale_data in sales_data]
+    already_written = stored_responses(SCOPE_SYNC_SALE, user_id, keys)
+
+    products = products_by_id(
+        item_product_id(item)
+        for sale_data in sales_data
+        for item in (sale_data.get('items') or [])
+    )
+    available = defaultdict(float, {product.id: product.stock_quantity or 0 for product in products.values()})
+
+    accepted = []
+    repeated = []  # نفس local_id مكرر داخل الدفعة
+    seen = set()
+    for key, sale_data in zip(keys, sales_data):
+        if key in already_written:
+            succeed(key, already_written[key], duplicate=True)
+            continue
+        if key in seen:
+            repeated.append((key, sale_data))
+            continue
+        if key:
+            seen.add(key)
+
+        try:
+            accepted.append((key, sale_data, _validate_sale(sale_data, products, available)))
+        except SaleRejected as e:
+            reject(key, sale_data, str(e))
+
+    for start in range(0, len(accepted), chunk_size):
+        chunk = accepted[start:start + chunk_size]
+        entries = [(sale_data, prepared) for _, sale_data, prepared in chunk]
+        try:
+            for (key, _, _), result in zip(chunk, _write_chunk(entries, user_id)):
+                succeed(key, result)
+        except Exception:
+            db.session.rollback()
+            # إعادة المحاولة بيعاً بيعاً حتى لا يفشل الجزء كله بسبب بيع واحد
+            for key, sale_data, prepared in chunk:
+                try:
+                    succeed(key, _write_chunk([(sale_data, prepared)], user_id)[0])
+                except Exception as e:
+                    db.session.rollback()
+                    # رفع متزامن لنفس البيع سبق هذا الطلب
+                    replay = stored_response(SCOPE_SYNC_SALE, user_id, key) if key else None
+                    if replay:
+                        succeed(key, replay[0], duplicate=True)
+                    else:
+                        reject(key, sale_data, str(e))
+
+    for key, sale_data in repeated:
+        ok, outcome = outcomes[key]
+        if ok:
+            succeed(key, outcome, duplicate=True)
+        else:
+            reject(key, sale_data, outcome)
+
+    return results
@@ -0,0 +1,77 @@
+"""
+Per-request SQL instrumentation
+
+Flask-SQLAlchemy records every statement of the current request when
+``SQLALCHEMY_RECORD_QUERIES`` is on. After each request the statements are
+counted and timed, and the figures are sent back in a ``Server-Timing``
+header (visible in the browser's network panel) and written to the log as
+one ``key=value`` line.
+
+Statements are also grouped by shape (the SQL text with IN lists collapsed),
+and a shape repeated more than ``SQL_REPEATED_QUERY_THRESHOLD`` times in one
+request is logged as a warning naming the endpoint and the first call site:
+the signature of a query run once per row (N+1). Statements run while a
+streamed response body is being sent are not included.
+"""
+
+import re
+import time
+from collections import Counter
+
+from flask import g, request
+from flask_sqlalchemy.record_queries import get_recorded_queries
+
+
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_IN_LIST = re.compile(r'\(\s*' + _PLACEHOLDER + r'(?:\s*,\s*' + _PLACEHOLDER + r')+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """نص الاستعلام بدون اختلافات عدد عناصر IN والمسافات"""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(?)', statement)).strip()
+
+
+def query_stats(queries):
+    """(عدد الاستعلامات، الوقت الكلي بالملي ثانية، Counter لأشكال الاستعلامات)"""
+    shapes = Counter(statement_shape(query.statement) for query in queries)
+    total_ms = sum(query.duration for query in queries) * 1000
+    return len(queries), total_ms, shapes
+
+
+def init_sql_instrumentation(app):
+    """تسجيل معالجات before/after_request لقياس استعلامات كل طلب"""
+    @app.before_request
+    def _start_request_timer():
+        g.request_started_at = time.perf_counter()
+        # الاستعلامات تُسجل في سياق التطبيق الذي قد يسبق الطلب (مثل أوامر CLI والاختبارات)
+        g.request_queries_offset = len(get_recorded_queries())
+
+    @app.after_request
+    def _report_request_queries(response):
+        if request.endpoint == 'static' or 'request_started_at' not in g:
+            return response
+
+        queries = get_recorded_queries()[g.request_queries_offset:]
+        count, db_ms, shapes = query_stats(queries)
+        total_ms = (time.perf_counter() - g.request_started_at) * 1000
+
+        response.headers.add('Server-Timing', f'db;desc="{count} queries";dur={db_ms:.1f}')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+        app.logger.info(
+            f'request method={request.method} path={request.path} endpoint={request.endpoint} '
+            f'status={response.status_code} queries={count} db_ms={db_ms:.1f} total_ms={total_ms:.1f}'
+        )
+
+        threshold = app.config.get('SQL_REPEATED_QUERY_THRESHOLD', 20)
+        for shape, repeats in shapes.most_common():
+            if repeats <= threshold:
+                break
+            location = next(query.location for query in queries if statement_shape(query.statement) == shape)
+            app.logger.warning(
+                f'Possible N+1 queries in endpoint={request.endpoint}: statement repeated {repeats} times '
+                f'(first from {location}): {shape[:300]}'
+            )
+
+        return response
@@ -219,6 +219,36 @@ class DatabaseManager {
     });
   }
 
+  // ==== المزامنة التزايدية ====
+  // تطبيق التغييرات القادمة من الخادم على مخزن واحد في معاملة واحدة
+  async applyDelta(storeName, items, deletedIds = [], replaceAll = false) {
+    await this.waitForInit();
+    return new Promise((resolve, reject) => {
+      const transaction = this.db.transaction([storeName], "readwrite");
+      const store = transaction.objectStore(storeName);
+      const lastUpdated = new Date().toISOString();
+
+      transaction.oncomplete = () => resolve();
+      transaction.onerror = () => reject(transaction.error);
+
+      // نسخة كاملة: حذف البيانات القديمة التي لم تعد موجودة على الخادم
+      if (replaceAll) {
+        store.clear();
+      }
+
+      items.forEach((item) => {
+        store.put({
+          ...item,
+          last_updated: lastUpdated,
+        });
+      });
+
+      deletedIds.forEach((id) => {
+        store.delete(id);
+      });
+    });
+  }
+
   // ==== عمليات العملاء ====
   async getCustomers(search = "") {
     await this.waitForInit();
@@ -365,7 +395,11 @@ class DatabaseManager {
         "readwrite"
       );
       const store = transaction.objectStore("pending_operations");
-      const request = store.add(operation);
+      // مفتاح ثابت للعملية يرسل مع كل محاولة حتى لا ينفذها الخادم مرتين
+      const request = store.add({
+        idempotency_key: this.generateIdempotencyKey(),
+        ...operation,
+      });
 
       request.onsuccess = () => resolve(request.result);
       request.onerror = () => reject(request.error);
@@ -412,6 +446,13 @@ class DatabaseManager {
     });
   }
 
+  generateIdempotencyKey() {
+    if (window.crypto && typeof window.crypto.randomUUID === "function") {
+      return window.crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2, 12)}`;
+  }
+
   // ==== الإعدادات ====
   async getSetting(key, defaultValue = null) {
     await this.waitForInit();
@@ -458,7 +499,10 @@ class DatabaseManager {
     ];
 
     return new Promise((resolve, reject) => {
-      const transaction = this.db.transaction(storeNames, "readwrite");
+      const transaction = this.db.transaction(
+        [...storeNames, "app_settings"],
+        "readwrite"
+      );
 
       transaction.oncomplete = () => resolve();
       transaction.onerror = () => reject(transaction.error);
@@ -467,6 +511,12 @@ class DatabaseManager {
         const store = transaction.objectStore(storeName);
         store.clear();
       });
+
+      // بدون بيانات محلية يجب أن تبدأ المزامنة التالية بنسخة كاملة
+      const settingsStore = transaction.objectStore("app_settings");
+      ["products", "categories", "customers"].forEach((storeName) => {
+        settingsStore.delete(`sync_cursor_${storeName}`);
+      });
     });
   }
 
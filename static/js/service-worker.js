@@ -146,14 +146,19 @@ self.addEventListener("fetch", (event) => {
 
 // معالجة طلبات API
 async function handleApiRequest(request) {
+  // ردود المزامنة التزايدية (?since=) صالحة مرة واحدة فقط ولا يتم تخزينها
+  const isDelta = new URL(request.url).searchParams.has("since");
+
   try {
     // محاولة الحصول على البيانات من الشبكة أولاً
     const networkResponse = await fetch(request);
 
     if (networkResponse.ok) {
       // حفظ النسخة الجديدة في التخزين المؤقت
-      const cache = await caches.open(API_CACHE);
-      cache.put(request, networkResponse.clone());
+      if (!isDelta) {
+        const cache = await caches.open(API_CACHE);
+        cache.put(request, networkResponse.clone());
+      }
       return networkResponse;
     }
   } catch (error) {
@@ -161,7 +166,7 @@ async function handleApiRequest(request) {
   }
 
   // في حالة فشل الشبكة، جرب التخزين المؤقت
-  const cachedResponse = await caches.match(request);
+  const cachedResponse = isDelta ? null : await caches.match(request);
   if (cachedResponse) {
     return cachedResponse;
   }
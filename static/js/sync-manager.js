@@ -141,20 +141,39 @@ class SyncManager {
   }
 
   async syncDataFromServer() {
+    // كل مخزن يحتفظ بمؤشر آخر مزامنة في app_settings، والخادم يرسل
+    // فقط ما تغير أو حُذف بعده
     const endpoints = [
-      { url: "/api/products", handler: "saveProducts" },
-      { url: "/api/categories", handler: "saveCategories" },
-      { url: "/api/customers", handler: "saveCustomers" },
+      { url: "/api/products", store: "products" },
+      { url: "/api/categories", store: "categories" },
+      { url: "/api/customers", store: "customers" },
     ];
 
+    if (!window.dbManager) return;
+
     for (const endpoint of endpoints) {
       try {
-        const response = await fetch(endpoint.url);
+        const cursorKey = `sync_cursor_${endpoint.store}`;
+        const cursor = await window.dbManager.getSetting(cursorKey, "");
+        const response = await fetch(
+          `${endpoint.url}?since=${encodeURIComponent(cursor)}`
+        );
+
         if (response.ok) {
-          const data = await response.json();
-          if (Array.isArray(data) && window.dbManager) {
-            await window.dbManager[endpoint.handler](data);
-            console.log(`✅ Synced ${endpoint.url}: ${data.length} items`);
+          const delta = await response.json();
+          if (Array.isArray(delta.items)) {
+            await window.dbManager.applyDelta(
+              endpoint.store,
+              delta.items,
+              delta.deleted || [],
+              delta.full
+            );
+            await window.dbManager.setSetting(cursorKey, delta.cursor);
+            console.log(
+              `✅ Synced ${endpoint.url}: ${delta.items.length} changed, ${
+                (delta.deleted || []).length
+              } deleted${delta.full ? " (full)" : ""}`
+            );
           }
         } else {
           console.warn(
@@ -199,12 +218,18 @@ class SyncManager {
   }
 
   async syncCreateSale(operation) {
+    const headers = {
+      "Content-Type": "application/json",
+      "X-CSRFToken": window.csrf_token || "",
+    };
+    // إعادة المحاولة بنفس المفتاح ترجع نتيجة البيع المحفوظ بدلاً من تكراره
+    if (operation.idempotency_key) {
+      headers["Idempotency-Key"] = operation.idempotency_key;
+    }
+
     const response = await fetch("/api/sales", {
       method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        "X-CSRFToken": window.csrf_token || "",
-      },
+      headers,
       body: JSON.stringify(operation.data),
     });
 
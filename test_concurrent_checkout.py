@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+اختبار البيع المتزامن لنظام Norko Store
+
+هذا السكريبت يشغل عدداً كبيراً من عمليات البيع في نفس اللحظة (خيط لكل
+عملية) على منتجات مخزونها محدود، ويتحقق من:
+1. عدم بيع أكثر من المخزون المتوفر (لا يصبح المخزون سالباً)
+2. أن عدد المبيعات الناجحة يساوي المخزون بالضبط، والباقي يُرفض برسالة واضحة
+3. تطابق المخزون النهائي مع الكميات المسجلة في أصناف المبيعات
+4. عدم حدوث أخطاء 500 أو انتظار طويل على الأقفال
+
+الاستخدام:
+    python test_concurrent_checkout.py [عدد العمليات] [رابط قاعدة البيانات]
+
+بدون رابط يتم استخدام ملف SQLite مؤقت. عند تمرير رابط (PostgreSQL مثلاً)
+يجب أن تكون قاعدة اختبار فارغة لأن جداولها تُحذف وتُنشأ من جديد.
+"""
+
+import os
+import sys
+import json
+import random
+import tempfile
+import threading
+import time
+
+# مخزون كل منتج في الاختبار؛ كل عملية بيع تطلب قطعة من كل منتج
+STOCK_PER_PRODUCT = 20
+PRODUCTS_COUNT = 3
+MAX_LATENCY_SECONDS = 5.0
+
+
+class ConcurrentCheckoutTestSuite:
+    def __init__(self, checkouts=60, database_url=None):
+        self.checkouts = checkouts
+        self.database_url = database_url
+        self.responses = []
+        self.responses_lock = threading.Lock()
+        self.results = {
+            'passed': 0,
+            'failed': 0,
+            'tests': []
+        }
+
+    def log(self, message, level="INFO"):
+        """طباعة رسالة مع الوقت والمستوى"""
+        timestamp = time.strftime("%H:%M:%S")
+        print(f"[{timestamp}] {level}: {message}")
+
+    def check(self, name, passed, message=''):
+        """تسجيل نتيجة اختبار واحد"""
+        self.log(f"{'✅' if passed else '❌'} {name} {message}".rstrip())
+        self.results['passed' if passed else 'failed'] += 1
+        self.results['tests'].append({'name': name, 'passed': passed, 'message': message})
+        return passed
+
+    def setup_application(self):
+        """تحميل التطبيق على قاعدة الاختبار وإنشاء البائع والمنتجات"""
+        if not self.database_url:
+            handle, path = tempfile.mkstemp(suffix='.db', prefix='checkout_test_')
+            os.close(handle)
+            self.database_url = f'sqlite:///{path}'
+
+        os.environ['FLASK_CONFIG'] = 'testing'
+        os.environ['TEST_DATABASE_URL'] = self.database_url
+
+        from app import app
+        from models import db, User, Category, Product
+
+        self.app = app
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            self.password = os.urandom(16).hex()
+            seller = User(username='checkout_tester', role='seller', is_active=True)
+            seller.set_password(self.password)
+            category = Category(name_ar='اختبار البيع المتزامن')
+            db.session.add_all([seller, category])
+            db.session.flush()
+
+            products = [
+                Product(name_ar=f'منتج اختبار {i + 1}', category_id=category.id,
+                        wholesale_price=10, retail_price=15,
+                        stock_quantity=STOCK_PER_PRODUCT, min_stock_threshold=1)
+                for i in range(PRODUCTS_COUNT)
+            ]
+            db.session.add_all(products)
+            db.session.commit()
+
+            self.product_ids = [product.id for product in products]
+
+        # تسجيل الدخول مرة واحدة ونسخ الجلسة لكل عملية (صفحة الدخول محدودة المعدل)
+        client = app.test_client()
+        client.post('/', data={'username': 'checkout_tester', 'password': self.password})
+        with client.session_transaction() as session:
+            self.login_session = dict(session)
+
+        self.log(f"🗄️ قاعدة البيانات: {self.database_url}")
+
+    def checkout(self, barrier):
+        """عملية بيع واحدة: قطعة من كل منتج بترتيب عشوائي"""
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session.update(self.login_session)
+
+        product_ids = list(self.product_ids)
+        random.shuffle(product_ids)
+        payload = {
+            'items': [
+                {'product_id': product_id, 'quantity': 1, 'unit_price': 15, 'total_price': 15}
+                for product_id in product_ids
+            ],
+            'subtotal': 15 * len(product_ids),
+            'total_amount': 15 * len(product_ids),
+            'payment_type': 'cash'
+        }
+
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            response = client.post('/api/sales', json=payload)
+            status, body = response.status_code, response.get_json(silent=True) or {}
+        except Exception as e:
+            status, body = 500, {'error': str(e)}
+        elapsed = time.perf_counter() - started
+
+        with self.responses_lock:
+            self.responses.append((status, body, elapsed))
+
+    def run_checkouts(self):
+        """تشغيل جميع العمليات في نفس اللحظة"""
+        self.log(f"=== {self.checkouts} عملية بيع متزامنة على مخزون {STOCK_PER_PRODUCT} لكل منتج ===")
+
+        barrier = threading.Barrier(self.checkouts)
+        threads = [threading.Thread(target=self.checkout, args=(barrier,)) for _ in range(self.checkouts)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.duration = time.perf_counter() - started
+
+    def test_results(self):
+        """التحقق من الردود ومن حالة قاعدة البيانات بعد الاختبار"""
+        from sqlalchemy import func
+        from models import db, Product, Sale, SaleItem
+
+        succeeded = [body for status, body, _ in self.responses if status == 200]
+        rejected = [body for status, body, _ in self.responses if status == 400]
+        errors = [(status, body) for status, body, _ in self.responses if status not in (200, 400)]
+        expected_sales = min(self.checkouts, STOCK_PER_PRODUCT)
+
+        self.check("No server errors", not errors, f"({len(errors)} errors)" if errors else '')
+        for status, body in errors[:5]:
+            self.log(f"   - {status}: {body.get('error', body)}", "ERROR")
+
+        self.check("Successful checkouts equal available stock",
+                   len(succeeded) == expected_sales, f"({len(succeeded)}/{expected_sales})")
+        self.check("Remaining checkouts rejected for insufficient stock",
+                   len(rejected) == self.checkouts - expected_sales and
+                   all('غير متوفرة' in body.get('error', '') for body in rejected),
+                   f"({len(rejected)})")
+
+        with self.app.app_context():
+            stock = dict(db.session.query(Product.id, Product.stock_quantity))
+            sold = dict(db.session.query(SaleItem.product_id, func.sum(SaleItem.quantity)).group_by(SaleItem.product_id))
+            sales_count = db.session.query(func.count(Sale.id)).scalar()
+
+        self.check("Stock never negative", all(quantity >= 0 for quantity in stock.values()),
+                   f"{sorted(stock.values())}")
+        self.check("Final stock matches recorded sale items", all(
+            stock[product_id] + (sold.get(product_id) or 0) == STOCK_PER_PRODUCT
+            for product_id in self.product_ids
+        ))
+        self.check("Sales written equal successful checkouts", sales_count == len(succeeded),
+                   f"({sales_count})")
+
+        latencies = sorted(elapsed for _, _, elapsed in self.responses)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.log(f"⏱️ المدة الكلية {self.duration:.2f}s - {len(latencies) / self.duration:.1f} عملية/ثانية")
+        self.log(f"⏱️ زمن العملية: p50 {p50 * 1000:.0f}ms - p95 {p95 * 1000:.0f}ms - max {latencies[-1] * 1000:.0f}ms")
+        self.check("No checkout waited on locks too long", latencies[-1] < MAX_LATENCY_SECONDS,
+                   f"(max {latencies[-1]:.2f}s < {MAX_LATENCY_SECONDS}s)")
+
+    def run_all_tests(self):
+        """تشغيل جميع الاختبارات"""
+        self.log("🚀 بدء اختبار البيع المتزامن لنظام Norko Store")
+        self.log("=" * 60)
+
+        self.setup_application()
+        self.run_checkouts()
+        self.test_results()
+
+        self.show_results()
+
+    def show_results(self):
+        """عرض نتائج الاختبار"""
+        self.log("=" * 60)
+        self.log("📊 نتائج الاختبار:")
+        self.log(f"✅ نجح: {self.results['passed']}")
+        self.log(f"❌ فشل: {self.results['failed']}")
+
+        failed_tests = [test for test in self.results['tests'] if not test['passed']]
+        if failed_tests:
+            self.log("\n❌ الاختبارات الفاشلة:")
+            for test in failed_tests:
+                self.log(f"   - {test['name']}: {test['message']}")
+
+        self.log("=" * 60)
+
+        try:
+            with open('concurrent_checkout_results.json', 'w', encoding='utf-8') as f:
+                json.dump(self.results, f, ensure_ascii=False, indent=2)
+            self.log("💾 تم حفظ النتائج في concurrent_checkout_results.json")
+        except Exception as e:
+            self.log(f"⚠️ فشل في حفظ النتائج: {str(e)}")
+
+
+def main():
+    """الدالة الرئيسية"""
+    # فحص المعاملات
+    checkouts = 60
+    database_url = None
+    if len(sys.argv) > 1:
+        checkouts = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        database_url = sys.argv[2]
+
+    # تشغيل الاختبارات
+    test_suite = ConcurrentCheckoutTestSuite(checkouts, database_url)
+    test_suite.run_all_tests()
+
+    # رمز الخروج
+    exit_code = 0 if test_suite.results['failed'] == 0 else 1
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+اختبار المزامنة التزايدية (?since=) لنظام Norko Store
+
+هذا السكريبت يتحقق من:
+1. أن المزامنة التزايدية لا ترسل شيئاً عند عدم وجود تعديلات
+2. أن تعديل اسم الفئة يرسل منتجاتها من جديد بالاسم الجديد
+3. أن نقل منتج بين فئتين يرسل الفئتين بعدد المنتجات الجديد
+4. أن حذف منتج يصل كمعرف محذوف ويحدث عدد منتجات فئته
+
+الاستخدام:
+    python test_delta_sync.py [رابط قاعدة البيانات]
+
+بدون رابط يتم استخدام ملف SQLite مؤقت. عند تمرير رابط (PostgreSQL مثلاً)
+يجب أن تكون قاعدة اختبار فارغة لأن جداولها تُحذف وتُنشأ من جديد.
+"""
+
+import os
+import sys
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+class DeltaSyncTestSuite:
+    def __init__(self, database_url=None):
+        self.database_url = database_url
+        self.results = {
+            'passed': 0,
+            'failed': 0,
+            'tests': []
+        }
+
+    def log(self, message, level="INFO"):
+        """طباعة رسالة مع الوقت والمستوى"""
+        timestamp = time.strftime("%H:%M:%S")
+        print(f"[{timestamp}] {level}: {message}")
+
+    def check(self, name, passed, message=''):
+        """تسجيل نتيجة اختبار واحد"""
+        self.log(f"{'✅' if passed else '❌'} {name} {message}".rstrip())
+        self.results['passed' if passed else 'failed'] += 1
+        self.results['tests'].append({'name': name, 'passed': passed, 'message': message})
+        return passed
+
+    def setup_application(self):
+        """تحميل التطبيق على قاعدة الاختبار وإنشاء المدير والفئات والمنتجات"""
+        if not self.database_url:
+            handle, path = tempfile.mkstemp(suffix='.db', prefix='delta_sync_test_')
+            os.close(handle)
+            self.database_url = f'sqlite:///{path}'
+
+        os.environ['FLASK_CONFIG'] = 'testing'
+        os.environ['TEST_DATABASE_URL'] = self.database_url
+
+        from app import app
+        from models import db, User, Category, Product
+
+        self.app = app
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            password = os.urandom(16).hex()
+            admin = User(username='delta_tester', role='admin', is_active=True)
+            admin.set_password(password)
+            books = Category(name_ar='كتب')
+            pens = Category(name_ar='أقلام')
+            db.session.add_all([admin, books, pens])
+            db.session.flush()
+
+            products = [
+                Product(name_ar=f'كتاب {i + 1}', category_id=books.id, wholesale_price=10, retail_price=15,
+                        stock_quantity=5, min_stock_threshold=1)
+                for i in range(3)
+            ]
+            db.session.add_all(products)
+            db.session.commit()
+
+            self.books_id, self.pens_id = books.id, pens.id
+            self.product_ids = [product.id for product in products]
+
+            # كل الصفوف أقدم من المؤشر حتى لا تظهر في المزامنة بسبب فترة التداخل
+            long_ago = datetime.utcnow() - timedelta(hours=1)
+            for table in (Category.__table__, Product.__table__):
+                db.session.execute(table.update().values(updated_at=long_ago))
+            db.session.commit()
+
+        self.client = app.test_client()
+        self.client.post('/', data={'username': 'delta_tester', 'password': password})
+        self.log(f"🗄️ قاعدة البيانات: {self.database_url}")
+
+    def pull(self, url):
+        """مزامنة تزايدية من المؤشر الحالي. ترجع بيانات الرد وتحفظ المؤشر التالي"""
+        response = self.client.get(url, query_string={'since': self.cursors[url]})
+        data = response.get_json()
+        self.cursors[url] = data['cursor']
+        return data
+
+    def test_delta_sync(self):
+        """تعديل الفئات والمنتجات والتحقق من وصولها في المزامنة التالية"""
+        from models import db, Category, Product
+
+        cursor = datetime.utcnow().isoformat()
+        self.cursors = {'/api/products': cursor, '/api/categories': cursor}
+
+        products, categories = self.pull('/api/products'), self.pull('/api/categories')
+        self.check("Nothing sent without changes", not products['items'] and not categories['items'],
+                   f"({len(products['items'])} products, {len(categories['items'])} categories)")
+
+        self.client.post(f'/categories/{self.books_id}/edit', data={'name_ar': 'كتب مدرسية', 'description_ar': ''})
+        products = self.pull('/api/products')
+        names = {item['id']: item['category'] for item in products['items']}
+        self.check("Renamed category resends its products",
+                   sorted(names) == sorted(self.product_ids), f"({len(names)}/{len(self.product_ids)})")
+        self.check("Resent products carry the new category name",
+                   set(names.values()) == {'كتب مدرسية'}, f"{sorted(set(names.values()))}")
+
+        self.pull('/api/categories')
+        with self.app.app_context():
+            product = db.session.get(Product, self.product_ids[0])
+            product.category_id = self.pens_id
+            db.session.commit()
+        counts = {item['id']: item['product_count'] for item in self.pull('/api/categories')['items']}
+        self.check("Moving a product resends both categories with new counts",
+                   counts == {self.books_id: 2, self.pens_id: 1}, f"{counts}")
+
+        with self.app.app_context():
+            db.session.delete(db.session.get(Product, self.product_ids[1]))
+            db.session.commit()
+        products = self.pull('/api/products')
+        counts = {item['id']: item['product_count'] for item in self.pull('/api/categories')['items']}
+        self.check("Deleted product sent as deleted id", self.product_ids[1] in products['deleted'])
+        self.check("Deleting a product resends its category", counts.get(self.books_id) == 1, f"{counts}")
+
+    def run_all_tests(self):
+        """تشغيل جميع الاختبارات"""
+        self.log("🚀 بدء اختبار المزامنة التزايدية لنظام Norko Store")
+        self.log("=" * 60)
+
+        self.setup_application()
+        self.test_delta_sync()
+
+        self.show_results()
+
+    def show_results(self):
+        """عرض نتائج الاختبار"""
+        self.log("=" * 60)
+        self.log("📊 نتائج الاختبار:")
+        self.log(f"✅ نجح: {self.results['passed']}")
+        self.log(f"❌ فشل: {self.results['failed']}")
+
+        failed_tests = [test for test in self.results['tests'] if not test['passed']]
+        if failed_tests:
+            self.log("\n❌ الاختبارات الفاشلة:")
+            for test in failed_tests:
+                self.log(f"   - {test['name']}: {test['message']}")
+
+        self.log("=" * 60)
+
+        try:
+            with open('delta_sync_results.json', 'w', encoding='utf-8') as f:
+                json.dump(self.results, f, ensure_ascii=False, indent=2)
+            self.log("💾 تم حفظ النتائج في delta_sync_results.json")
+        except Exception as e:
+            self.log(f"⚠️ فشل في حفظ النتائج: {str(e)}")
+
+
+def main():
+    """الدالة الرئيسية"""
+    database_url = sys.argv[1] if len(sys.argv) > 1 else None
+
+    test_suite = DeltaSyncTestSuite(database_url)
+    test_suite.run_all_tests()
+
+    exit_code = 0 if test_suite.results['failed'] == 0 else 1
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
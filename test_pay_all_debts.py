@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+اختبار تسديد كل الديون (/api/pay-all-debts) لنظام Norko Store
+
+هذا السكريبت يتحقق من:
+1. أن فشل إحدى المعاملات لا يلغي ما تم حفظه في المعاملات السابقة
+2. أن الرد عند الفشل يحتوي على ما تم تسديده فعلاً
+3. أن إحصائيات الديون المخزنة تُمسح حتى عند الفشل
+4. أن أرصدة العملاء تطابق الدفعات المسجلة، وأن إعادة التسديد تكمل الباقي
+
+الاستخدام:
+    python test_pay_all_debts.py [رابط قاعدة البيانات]
+
+بدون رابط يتم استخدام ملف SQLite مؤقت. عند تمرير رابط (PostgreSQL مثلاً)
+يجب أن تكون قاعدة اختبار فارغة لأن جداولها تُحذف وتُنشأ من جديد.
+"""
+
+import os
+import sys
+import json
+import tempfile
+import time
+
+CUSTOMERS_COUNT = 6
+SALES_PER_CUSTOMER = 2
+SALE_AMOUNT = 100
+BATCH_SIZE = 2
+
+
+class PayAllDebtsTestSuite:
+    def __init__(self, database_url=None):
+        self.database_url = database_url
+        self.results = {
+            'passed': 0,
+            'failed': 0,
+            'tests': []
+        }
+
+    def log(self, message, level="INFO"):
+        """طباعة رسالة مع الوقت والمستوى"""
+        timestamp = time.strftime("%H:%M:%S")
+        print(f"[{timestamp}] {level}: {message}")
+
+    def check(self, name, passed, message=''):
+        """تسجيل نتيجة اختبار واحد"""
+        self.log(f"{'✅' if passed else '❌'} {name} {message}".rstrip())
+        self.results['passed' if passed else 'failed'] += 1
+        self.results['tests'].append({'name': name, 'passed': passed, 'message': message})
+        return passed
+
+    def setup_application(self):
+        """تحميل التطبيق على قاعدة الاختبار وإنشاء عملاء بمبيعات آجلة"""
+        if not self.database_url:
+            handle, path = tempfile.mkstemp(suffix='.db', prefix='pay_all_debts_test_')
+            os.close(handle)
+            self.database_url = f'sqlite:///{path}'
+
+        os.environ['FLASK_CONFIG'] = 'testing'
+        os.environ['TEST_DATABASE_URL'] = self.database_url
+
+        from app import app
+        from models import db, User, Customer, Sale
+        from ledger import reconcile_customer_balances
+
+        self.app = app
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+            password = os.urandom(16).hex()
+            admin = User(username='debts_tester', role='admin', is_active=True)
+            admin.set_password(password)
+            customers = [Customer(name=f'عميل اختبار {i + 1}') for i in range(CUSTOMERS_COUNT)]
+            db.session.add(admin)
+            db.session.add_all(customers)
+            db.session.flush()
+
+            for customer in customers:
+                for _ in range(SALES_PER_CUSTOMER):
+                    db.session.add(Sale(subtotal=SALE_AMOUNT, total_amount=SALE_AMOUNT, user_id=admin.id,
+                                        customer_id=customer.id, payment_type='credit', payment_status='unpaid'))
+            db.session.commit()
+            reconcile_customer_balances(fix=True)
+
+            self.customer_ids = [customer.id for customer in customers]
+
+        self.client = app.test_client()
+        self.client.post('/', data={'username': 'debts_tester', 'password': password})
+        self.log(f"🗄️ قاعدة البيانات: {self.database_url}")
+
+    def paid_customers(self):
+        """معرفات العملاء الذين لم يعد عليهم دين"""
+        from models import db, Customer
+        with self.app.app_context():
+            return sorted(customer_id for customer_id, balance in
+                          db.session.query(Customer.id, Customer.balance) if balance <= 0)
+
+    def test_failed_batch(self):
+        """فشل المعاملة الثانية بعد حفظ الأولى"""
+        import app as application
+        import debt_payments
+
+        allocate_payments = debt_payments.allocate_payments
+        calls = []
+
+        def failing_allocate_payments(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('خطأ مصطنع في المعاملة الثانية')
+            return allocate_payments(*args, **kwargs)
+
+        debt_payments.PAYMENT_BATCH_SIZE = BATCH_SIZE
+        debt_payments.allocate_payments = failing_allocate_payments
+        application.debt_stats_cache.set('global', {'global_total_debt': -1})
+        try:
+            response = self.client.post('/api/pay-all-debts', json={'customer_ids': self.customer_ids})
+        finally:
+            debt_payments.allocate_payments = allocate_payments
+
+        data = response.get_json() or {}
+        first_batch = sorted(self.customer_ids)[:BATCH_SIZE]
+        self.check("Failed batch answered with an error", response.status_code == 500 and not data.get('success'),
+                   f"({response.status_code})")
+        self.check("Error reports what the first batch paid",
+                   data.get('customers_paid') == BATCH_SIZE and
+                   data.get('payments_count') == BATCH_SIZE * SALES_PER_CUSTOMER and
+                   data.get('total_amount') == BATCH_SIZE * SALES_PER_CUSTOMER * SALE_AMOUNT,
+                   f"{ {key: data.get(key) for key in ('customers_paid', 'payments_count', 'total_amount')} }")
+        self.check("First batch stays committed", self.paid_customers() == first_batch,
+                   f"{self.paid_customers()}")
+        self.check("Debt stats cache cleared on failure", application.debt_stats_cache.get('global') is None)
+
+    def test_retry(self):
+        """إعادة التسديد تكمل العملاء الباقين دون تكرار الدفعات"""
+        from ledger import reconcile_customer_balances
+
+        response = self.client.post('/api/pay-all-debts', json={'customer_ids': self.customer_ids})
+        data = response.get_json() or {}
+        self.check("Retry pays the remaining customers",
+                   response.status_code == 200 and data.get('customers_paid') == CUSTOMERS_COUNT - BATCH_SIZE,
+                   f"({response.status_code}, {data.get('customers_paid')})")
+        self.check("No customer left in debt", self.paid_customers() == sorted(self.customer_ids))
+        with self.app.app_context():
+            mismatches = reconcile_customer_balances()
+        self.check("Balances match recorded payments", not mismatches, f"({len(mismatches)} mismatches)")
+
+    def run_all_tests(self):
+        """تشغيل جميع الاختبارات"""
+        self.log("🚀 بدء اختبار تسديد كل الديون لنظام Norko Store")
+        self.log("=" * 60)
+
+        self.setup_application()
+        self.test_failed_batch()
+        self.test_retry()
+
+        self.show_results()
+
+    def show_results(self):
+        """عرض نتائج الاختبار"""
+        self.log("=" * 60)
+        self.log("📊 نتائج الاختبار:")
+        self.log(f"✅ نجح: {self.results['passed']}")
+        self.log(f"❌ فشل: {self.results['failed']}")
+
+        failed_tests = [test for test in self.results['tests'] if not test['passed']]
+        if failed_tests:
+            self.log("\n❌ الاختبارات الفاشلة:")
+            for test in failed_tests:
+                self.log(f"   - {test['name']}: {test['message']}")
+
+        self.log("=" * 60)
+
+        try:
+            with open('pay_all_debts_results.json', 'w', encoding='utf-8') as f:
+                json.dump(self.results, f, ensure_ascii=False, indent=2)
+            self.log("💾 تم حفظ النتائج في pay_all_debts_results.json")
+        except Exception as e:
+            self.log(f"⚠️ فشل في حفظ النتائج: {str(e)}")
+
+
+def main():
+    """الدالة الرئيسية"""
+    database_url = sys.argv[1] if len(sys.argv) > 1 else None
+
+    test_suite = PayAllDebtsTestSuite(database_url)
+    test_suite.run_all_tests()
+
+    exit_code = 0 if test_suite.results['failed'] == 0 else 1
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()